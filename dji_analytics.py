@@ -0,0 +1,348 @@
+''' module for derived flight metrics of dji mavic pro flight logs: flight
+    phases, climb rates, 3D distance, energy and battery cell imbalance,
+    vectorized with numpy over the flightdata arrays
+'''
+import argparse
+import numpy as np
+import pandas as pd
+from dji_mavic_io import read_flightdata_csv, FEET_METER_CONV, MILES_KM_CONV
+from dji_ingest import get_flight_files
+from dji_resample import resample_flightdata
+
+
+EARTH_RADIUS = 6_371_000  # meter
+hover_speed = 1.0  # mph, below this horizontal speed a flying drone can hover
+hover_climb_rate = 0.5  # m/s, and below this vertical speed
+min_phase_time = 3.0  # seconds, shorter hover and cruise runs are merged
+MPH_MS_CONV = MILES_KM_CONV / 3.6
+cell_columns = [f'voltageCell{i}' for i in range(1, 7)]
+analytics_columns = [
+    'time(millisecond)', 'latitude', 'longitude', 'height_above_takeoff(feet)',
+    'speed(mph)', ' zSpeed(mph)', 'voltage(v)', 'current(A)', 'flycStateRaw', 'flycState',
+    *cell_columns,
+]
+
+# flight phases, the phase of a sample is a code into phase_names
+GROUND, TAKEOFF, HOVER, CRUISE, RTH, LANDING = range(6)
+phase_names = ['ground', 'takeoff', 'hover', 'cruise', 'rth', 'landing']
+
+# flycStateRaw codes and flycState names that set the phase, all other
+# states are flying and split in hover and cruise by the speeds
+flyc_state_raw_phases = {
+    10: TAKEOFF,  # Assisted_Takeoff
+    11: TAKEOFF,  # AutoTakeoff
+    12: LANDING,  # AutoLanding
+    13: LANDING,  # AttiLanding
+    15: RTH,      # Go_Home
+    33: LANDING,  # Confirm_Landing
+    41: GROUND,   # Motors_Started
+}
+flyc_state_phases = {
+    'Assisted_Takeoff': TAKEOFF,
+    'AutoTakeoff': TAKEOFF,
+    'AutoLanding': LANDING,
+    'AttiLanding': LANDING,
+    'Go_Home': RTH,
+    'Confirm_Landing': LANDING,
+    'Motors_Started': GROUND,
+}
+flying = -1
+flyc_state_raw_lookup = np.full(256, flying, dtype=np.int8)
+for _code, _phase in flyc_state_raw_phases.items():
+    flyc_state_raw_lookup[_code] = _phase
+
+
+def get_climb_rate(flightdata_df: pd.DataFrame) -> np.ndarray:
+    ''' climb rate in m/s from zSpeed, which is positive going down; the
+        height is in whole feet, so its differences per sample are too
+        coarse for a rate
+    '''
+    return np.nan_to_num(
+        0 - flightdata_df[' zSpeed(mph)'].to_numpy(dtype=np.float64) * MPH_MS_CONV)
+
+
+def get_hover(time_s, speed, climb_rate) -> np.ndarray:
+    ''' hover per sample, the drone is still horizontally and vertically
+        for the majority of the samples in a centered window of
+        min_phase_time, so noise in the speeds does not flip the phase
+    '''
+    still = (speed < hover_speed) & (np.abs(climb_rate) < hover_climb_rate)
+    counts = np.concatenate(([0], np.cumsum(still)))
+    start = np.searchsorted(time_s, time_s - 0.5 * min_phase_time, side='left')
+    end = np.searchsorted(time_s, time_s + 0.5 * min_phase_time, side='right')
+    return 2 * (counts[end] - counts[start]) > end - start
+
+
+def merge_short_runs(phases, time_s) -> np.ndarray:
+    ''' hover and cruise runs shorter than min_phase_time take the phase
+        of the previous run, or of the next run if the previous is not
+        hover or cruise; a run between two other phases takes the phase of
+        the previous run, or of the next run at the start, in place
+    '''
+    starts = get_segments(phases)
+    ends = np.append(starts[1:], len(phases))
+    end_times = np.append(time_s[starts[1:]], time_s[-1] if len(time_s) else 0)
+    for start, end, end_time in zip(starts, ends, end_times):
+        if phases[start] not in (HOVER, CRUISE) or end_time - time_s[start] >= min_phase_time:
+            continue
+
+        previous = phases[start - 1] if start > 0 else flying
+        following = phases[end] if end < len(phases) else flying
+        if previous in (HOVER, CRUISE):
+            phases[start:end] = previous
+
+        elif following in (HOVER, CRUISE):
+            phases[start:end] = following
+
+        elif previous != flying:
+            phases[start:end] = previous
+
+        elif following != flying:
+            phases[start:end] = following
+
+    return phases
+
+
+def get_phases(flightdata_df: pd.DataFrame) -> np.ndarray:
+    ''' phase code per sample from flycStateRaw, or flycState if the raw
+        codes are missing, with flying states split in hover and cruise
+        by the horizontal and vertical speed
+        argument:
+            flightdata_df: flightdata with time(millisecond), flycStateRaw
+                           or flycState, speed(mph) and zSpeed(mph)
+        returns:
+            int8 array of phase codes, see phase_names
+    '''
+    if 'flycStateRaw' in flightdata_df and flightdata_df['flycStateRaw'].notna().any():
+        codes = flightdata_df['flycStateRaw'].to_numpy(dtype=np.float64)
+        codes = np.where(np.isnan(codes), 0, codes).astype(np.int64)
+        phases = flyc_state_raw_lookup[np.clip(codes, 0, len(flyc_state_raw_lookup) - 1)]
+
+    else:
+        states = flightdata_df['flycState'].astype('category')
+        category_phases = np.array(
+            [flyc_state_phases.get(name, flying) for name in states.cat.categories] + [flying],
+            dtype=np.int8)
+        # code -1 (missing) indexes the last entry
+        phases = category_phases[states.cat.codes.to_numpy()]
+
+    time_s = flightdata_df['time(millisecond)'].to_numpy(dtype=np.float64) / 1000
+    hover = get_hover(
+        time_s, flightdata_df['speed(mph)'].to_numpy(dtype=np.float64),
+        get_climb_rate(flightdata_df))
+    phases = np.where(phases == flying, np.where(hover, HOVER, CRUISE), phases)
+    return merge_short_runs(phases.astype(np.int8), time_s)
+
+
+def get_segments(phases: np.ndarray) -> np.ndarray:
+    ''' start indices of runs of equal phase '''
+    if len(phases) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    return np.concatenate(([0], np.flatnonzero(np.diff(phases)) + 1))
+
+
+def get_cell_imbalance(flightdata_df: pd.DataFrame) -> np.ndarray:
+    ''' maximum minus minimum cell voltage per sample, cells that read zero
+        are not present in the battery and are ignored
+    '''
+    cells = flightdata_df[cell_columns].to_numpy(dtype=np.float64)
+    present = cells > 0
+    high = np.where(present, cells, -np.inf).max(axis=1)
+    low = np.where(present, cells, np.inf).min(axis=1)
+    return np.where(present.sum(axis=1) > 1, high - low, np.nan)
+
+
+def get_derived(flightdata_df: pd.DataFrame) -> dict:
+    ''' derived per sample arrays
+        argument:
+            flightdata_df: flightdata with analytics_columns
+        returns:
+            dict of numpy arrays: time (s), dt (s), height (m), climb_rate (m/s),
+            distance_3d (m, per step), power (W), energy (Wh, per step),
+            cell_imbalance (V) and phase
+    '''
+    time_s = flightdata_df['time(millisecond)'].to_numpy(dtype=np.float64) / 1000
+    lats = np.radians(flightdata_df['latitude'].to_numpy(dtype=np.float64))
+    lons = np.radians(flightdata_df['longitude'].to_numpy(dtype=np.float64))
+    height = flightdata_df['height_above_takeoff(feet)'].to_numpy(
+        dtype=np.float64) * FEET_METER_CONV
+
+    # local equirectangular steps are accurate to well below a meter at
+    # the distances between samples
+    dx = np.diff(lons, prepend=lons[:1]) * np.cos(lats) * EARTH_RADIUS
+    dy = np.diff(lats, prepend=lats[:1]) * EARTH_RADIUS
+    dz = np.diff(height, prepend=height[:1])
+    dt = np.diff(time_s, prepend=time_s[:1])
+    distance_3d = np.sqrt(dx**2 + dy**2 + dz**2)
+
+    climb_rate = get_climb_rate(flightdata_df)
+    power = np.abs(
+        flightdata_df['voltage(v)'].to_numpy(dtype=np.float64) *
+        flightdata_df['current(A)'].to_numpy(dtype=np.float64))
+    power = np.nan_to_num(power)
+
+    # trapezoid rule, the energy of a step is attributed to its end sample
+    energy = 0.5 * (power + np.roll(power, 1)) * dt / 3600
+    if len(energy):
+        energy[0] = 0.0
+
+    return {
+        'time': time_s,
+        'dt': dt,
+        'height': height,
+        'climb_rate': climb_rate,
+        'distance_3d': distance_3d,
+        'power': power,
+        'energy': energy,
+        'cell_imbalance': get_cell_imbalance(flightdata_df),
+        'phase': get_phases(flightdata_df),
+    }
+
+
+def segment_metrics(flightdata_df: pd.DataFrame, derived=None) -> pd.DataFrame:
+    ''' metrics per flight segment, a segment is a run of samples with the
+        same phase
+        arguments:
+            flightdata_df: flightdata with analytics_columns
+            derived: optional result of get_derived for flightdata_df
+        returns:
+            dataframe with a row per segment
+    '''
+    derived = derived if derived is not None else get_derived(flightdata_df)
+    starts = get_segments(derived['phase'])
+    if len(starts) == 0:
+        return pd.DataFrame()
+
+    ends = np.append(starts[1:], len(derived['phase']))
+    time_s = derived['time']
+    climb_rate = derived['climb_rate']
+    distance = np.add.reduceat(derived['distance_3d'], starts)
+    energy = np.add.reduceat(derived['energy'], starts)
+    duration = time_s[ends - 1] - time_s[starts]
+    dz = derived['height'][ends - 1] - derived['height'][starts]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_climb_rate = np.where(duration > 0, dz / duration, 0.0)
+
+    return pd.DataFrame({
+        'phase': np.array(phase_names)[derived['phase'][starts]],
+        'start_s': time_s[starts] - time_s[0],
+        'duration_s': duration,
+        'samples': ends - starts,
+        'distance_3d_m': distance,
+        'height_change_m': dz,
+        'mean_climb_rate_ms': mean_climb_rate,
+        'max_climb_rate_ms': np.maximum.reduceat(climb_rate, starts),
+        'max_descent_rate_ms': 0 - np.minimum.reduceat(climb_rate, starts),
+        'energy_wh': energy,
+    })
+
+
+def flight_metrics(flightdata_df: pd.DataFrame, derived=None) -> dict:
+    ''' metrics of a whole flight
+        arguments:
+            flightdata_df: flightdata with analytics_columns
+            derived: optional result of get_derived for flightdata_df
+        returns:
+            dict of metrics, with the time in seconds per phase
+    '''
+    derived = derived if derived is not None else get_derived(flightdata_df)
+    time_s = derived['time']
+    distance = float(np.sum(derived['distance_3d']))
+    energy = float(np.sum(derived['energy']))
+    imbalance = derived['cell_imbalance']
+    phase_time = np.bincount(
+        derived['phase'], weights=derived['dt'], minlength=len(phase_names))
+    max_speed = float(np.nanmax(flightdata_df['speed(mph)'])) * MILES_KM_CONV
+
+    metrics = {
+        'duration_s': float(time_s[-1] - time_s[0]),
+        'distance_3d_m': distance,
+        'max_height_m': float(np.nanmax(derived['height'])),
+        'max_speed_kmh': max_speed,
+        'max_climb_rate_ms': float(np.max(derived['climb_rate'])),
+        'max_descent_rate_ms': float(-np.min(derived['climb_rate'])),
+        'energy_wh': energy,
+        'energy_per_km_wh': energy / distance * 1000 if distance > 0 else np.nan,
+        'mean_power_w': float(np.mean(derived['power'])),
+        'mean_cell_imbalance_v': (
+            float(np.nanmean(imbalance)) if np.any(~np.isnan(imbalance)) else np.nan),
+        'max_cell_imbalance_v': (
+            float(np.nanmax(imbalance)) if np.any(~np.isnan(imbalance)) else np.nan),
+    }
+    for name, seconds in zip(phase_names, phase_time):
+        metrics[f'{name}_s'] = float(seconds)
+
+    return metrics
+
+
+def analyze_flight(flightdata_df: pd.DataFrame) -> tuple:
+    ''' flight metrics and segment metrics of a flight
+        returns:
+            dict of flight metrics, dataframe of segment metrics
+    '''
+    derived = get_derived(flightdata_df)
+    return flight_metrics(flightdata_df, derived), segment_metrics(flightdata_df, derived)
+
+
+def read_analytics_flightdata(file_name, rate=None) -> pd.DataFrame:
+    ''' flightdata with the analytics columns, optionally resampled to rate
+        samples per second so all flights have the same time step
+    '''
+    flightdata_df = read_flightdata_csv(file_name, columns=analytics_columns)
+    if rate and not flightdata_df.empty:
+        flightdata_df = resample_flightdata(flightdata_df, rate=rate)
+
+    return flightdata_df
+
+
+def analyze_files(path_or_glob, rate=None) -> pd.DataFrame:
+    ''' flight metrics of all logs of a folder or glob pattern, logs are read
+        with only the analytics columns through the columnar cache
+        arguments:
+            path_or_glob: csv file, folder or glob pattern of csv files
+            rate: if given, resample the flightdata to rate samples per second
+        returns:
+            dataframe with a row per flight
+    '''
+    flights = []
+    for file_name in get_flight_files(path_or_glob):
+        flightdata_df = read_analytics_flightdata(file_name, rate=rate)
+        if flightdata_df.empty:
+            continue
+
+        try:
+            flights.append({'file': str(file_name), **flight_metrics(flightdata_df)})
+
+        except (ValueError, KeyError, IndexError) as e:
+            print(f'unable to analyze {file_name}, error message: {e}')
+
+    return pd.DataFrame(flights)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='derived metrics of flight logs')
+    parser.add_argument('path', help='csv file, folder or glob pattern of csv files')
+    parser.add_argument('--segments', action='store_true', help='show segments of each flight')
+    parser.add_argument(
+        '--rate', type=float, default=None, help='resample to a uniform rate in Hz')
+    args = parser.parse_args()
+
+    with pd.option_context(
+            'display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        if args.segments:
+            for file_name in get_flight_files(args.path):
+                flightdata_df = read_analytics_flightdata(file_name, rate=args.rate)
+                if flightdata_df.empty:
+                    continue
+
+                _, segments_df = analyze_flight(flightdata_df)
+                print(file_name)
+                print(segments_df.round(2))
+
+        else:
+            print(analyze_files(args.path, rate=args.rate).round(2).T)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+''' headless benchmark of the load, project and render pipeline of the dji
+    mavic pro displays on the test log and on logs scaled by tiling,
+    results are stored as json to compare versions
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import itertools
+import subprocess
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np  #pylint: disable=wrong-import-position
+import pandas as pd  #pylint: disable=wrong-import-position
+import psutil  #pylint: disable=wrong-import-position
+from dji_mavic_io import (  #pylint: disable=wrong-import-position
+    read_flightdata_csv, write_flightdata_cache, read_flightdata_cache,
+)
+from dji_remote_control import RemoteControlDisplay  #pylint: disable=wrong-import-position
+from dji_flight_graphs import GraphDisplay  #pylint: disable=wrong-import-position
+from dji_map import MapDisplay  #pylint: disable=wrong-import-position
+from dji_playback import PlaybackClock, frame_interval  #pylint: disable=wrong-import-position
+
+try:
+    import resource
+
+except ImportError:
+    resource = None
+
+
+test_file = 'dji_mavic_test_data.csv'
+default_scales = [1, 10, 100]
+default_frames = 200
+default_repeats = 3
+default_threshold = 0.1  # a stage 10% slower than the baseline is a regression
+min_regression = 0.002  # seconds, smaller slowdowns of a stage are noise
+# frames replay at a fixed speed and frame rate, so every scale steps the
+# same number of samples per frame and takes the same update path
+bench_speed = 10
+bench_fps = 1000 / frame_interval
+
+
+def get_peak_memory() -> int:
+    ''' peak resident memory of this process in bytes '''
+    memory_info = psutil.Process(os.getpid()).memory_info()
+    if hasattr(memory_info, 'peak_wset'):
+        return memory_info.peak_wset
+
+    if resource:
+        # ru_maxrss is in kilobytes on linux and in bytes on macos
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    return memory_info.rss
+
+
+def get_version() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+            check=True, cwd=Path(__file__).parent,
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_scaled_log(file_name, scale, output_file):
+    ''' write a log of scale copies of file_name one after the other, the
+        time of each copy continues from the end of the previous one
+    '''
+    raw_df = pd.read_csv(file_name)
+    time_ms = raw_df['time(millisecond)']
+    duration = time_ms.iloc[-1] - time_ms.iloc[0] + 100
+    for i in range(scale):
+        copy_df = raw_df.copy()
+        copy_df['time(millisecond)'] = time_ms + i * duration
+        copy_df.to_csv(output_file, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+
+def timer(func, *args, **kwargs) -> tuple:
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_frames(display, update, indices) -> dict:
+    ''' time update and blit of a display over the frame indices, the
+        first blit captures the background and is timed separately
+        returns:
+            dict with the capture time and the mean, p50 and p95 frame time in seconds
+    '''
+    update(indices[0])
+    _, capture = timer(display.blit)
+    times = np.empty(len(indices))
+    for i, index in enumerate(indices):
+        start = time.perf_counter()
+        update(index)
+        display.blit()
+        times[i] = time.perf_counter() - start
+
+    return {
+        'capture': capture,
+        'frame_mean': float(times.mean()),
+        'frame_p50': float(np.percentile(times, 50)),
+        'frame_p95': float(np.percentile(times, 95)),
+    }
+
+
+def bench_log(file_name, frames=default_frames) -> dict:
+    ''' benchmark of one log, run in a separate process so the peak memory
+        is of this log only
+        returns:
+            dict with the rows and the seconds per stage
+    '''
+    result = {'rows': 0, 'bytes': Path(file_name).stat().st_size}
+    flightdata_df, result['parse_csv'] = timer(
+        read_flightdata_csv, file_name, use_cache=False)
+    result['rows'] = len(flightdata_df)
+
+    cache_path = Path(tempfile.mkdtemp()) / 'cache'
+    try:
+        _, result['write_cache'] = timer(write_flightdata_cache, flightdata_df, cache_path)
+        _, result['read_cache'] = timer(read_flightdata_cache, cache_path)
+
+    finally:
+        shutil.rmtree(cache_path.parent, ignore_errors=True)
+
+    # basemap=False leaves out the tile fetch, the map is projection,
+    # simplification and plotting only; the graph display includes
+    # setup_graphs
+    md, result['map_display'] = timer(MapDisplay, flightdata_df, basemap=False)
+    gd, result['graph_display'] = timer(GraphDisplay, flightdata_df, incremental=True)
+    rcd, result['rc_display'] = timer(RemoteControlDisplay, flightdata_df)
+
+    clock = PlaybackClock(
+        flightdata_df['time(millisecond)'].to_numpy(dtype=np.float64), speed=bench_speed)
+    indices = np.array(list(itertools.islice(clock.frame_indices(bench_fps), frames)))
+    for name, display, update in [
+            ('graph', gd, gd.update), ('map', md, md.update_location),
+            ('rc', rcd, rcd.update)]:
+        for key, value in bench_frames(display, update, indices).items():
+            result[f'{name}_{key}'] = value
+
+        display.remove_fig()
+
+    result['peak_memory'] = get_peak_memory()
+    return result
+
+
+def get_median_result(results) -> dict:
+    return {
+        key: float(np.median([result[key] for result in results]))
+        if key not in ['rows', 'bytes'] else results[0][key]
+        for key in results[0]
+    }
+
+
+def run_benchmark(file_name=test_file, scales=None, frames=default_frames,
+                  repeats=default_repeats) -> dict:
+    ''' benchmark the log and logs scaled by tiling, each run in its own
+        process, the result per scale is the median of repeats runs
+        returns:
+            dict with version, platform and per scale results
+    '''
+    scales = scales or default_scales
+    report = {
+        'version': get_version(),
+        'timestamp': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'file': str(file_name),
+        'frames': frames,
+        'repeats': repeats,
+        'results': {},
+    }
+    temp_folder = Path(tempfile.mkdtemp())
+    try:
+        for scale in scales:
+            scaled_file = file_name
+            if scale > 1:
+                scaled_file = temp_folder / f'scaled_{scale}.csv'
+                make_scaled_log(file_name, scale, scaled_file)
+
+            results = []
+            for _ in range(repeats):
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    results.append(executor.submit(bench_log, scaled_file, frames).result())
+
+            result = get_median_result(results)
+
+            report['results'][f'{scale}x'] = result
+            print_result(f'{scale}x', result)
+
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+    return report
+
+
+def print_result(name, result):
+    print(f'{name}: {result["rows"]:,} rows, peak memory '
+          f'{result["peak_memory"] / 1024**2:,.0f} MB')
+    for key, value in result.items():
+        if key not in ['rows', 'bytes', 'peak_memory']:
+            print(f'    {key:24} {value * 1000:10.2f} ms')
+
+
+def compare(report, baseline, threshold=default_threshold) -> list:
+    ''' compare the stage times and peak memory of a report with a baseline,
+        a stage is a regression if it is threshold slower and also at
+        least min_regression seconds slower, so noise of stages of a few
+        milliseconds is not flagged
+        returns:
+            list of (scale, key, baseline value, value, ratio) of regressions
+    '''
+    regressions = []
+    for scale, result in report['results'].items():
+        base_result = baseline['results'].get(scale, {})
+        for key, value in result.items():
+            base_value = base_result.get(key)
+            if key in ['rows', 'bytes'] or not base_value:
+                continue
+
+            ratio = value / base_value
+            print(f'{scale:>5} {key:24} {base_value:14.4g} {value:14.4g} {ratio:6.2f}x')
+            floor = 0 if key == 'peak_memory' else min_regression
+            if ratio > 1 + threshold and value - base_value > floor:
+                regressions.append((scale, key, base_value, value, ratio))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the flight log pipeline')
+    parser.add_argument('--file', default=test_file, help='log to benchmark')
+    parser.add_argument(
+        '--scales', type=int, nargs='+', default=default_scales,
+        help='benchmark copies of the log tiled this many times')
+    parser.add_argument('--frames', type=int, default=default_frames)
+    parser.add_argument(
+        '--repeats', type=int, default=default_repeats,
+        help='runs per scale, the median is reported')
+    parser.add_argument('--output', default='benchmark.json', help='json file for the results')
+    parser.add_argument('--compare', help='json file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=default_threshold)
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.file, scales=args.scales, frames=args.frames, repeats=args.repeats)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f'results written to {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        print(f'compare with {baseline.get("version")} ({baseline.get("timestamp")})')
+        regressions = compare(report, baseline, threshold=args.threshold)
+        for scale, key, _, _, ratio in regressions:
+            print(f'regression: {scale} {key} {ratio:.2f}x')
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+''' module for coordinated blitting of the dji mavic pro displays
+'''
+import time
+from utils.plogger import Profiler
+
+
+class BlitManager:
+    ''' restores, draws and blits the animated artists of one or more
+        displays with a single flush of events per frame
+        a display provides:
+            fig: matplotlib figure
+            background: None when the background must be (re)captured, for
+                        example after a resize, otherwise set by the manager
+            blit_regions(): list of (bbox, artists) to restore, draw and blit
+            progressive: optional, if True the region is copied again after
+                         drawing, so the artists accumulate in the background
+            draw_background(): optional, draws on top of the full draw
+                               before the background is captured
+        methods:
+            add_display: register a display
+            capture: full draw of a display and capture of its backgrounds
+            blit: blit all displays and flush events once
+        with the Profiler enabled the blit time of each display is recorded
+        as blit.<display class>
+    '''
+
+    def __init__(self, displays=None):
+        self.displays = []
+        for display in displays or []:
+            self.add_display(display)
+
+    def add_display(self, display):
+        display.background = None
+        self.displays.append(display)
+
+    def capture(self, display):
+        canvas = display.fig.canvas
+        canvas.draw()
+        if hasattr(display, 'draw_background'):
+            display.draw_background()
+
+        display.background = [
+            canvas.copy_from_bbox(bbox) for bbox, _ in display.blit_regions()
+        ]
+        canvas.blit(display.fig.bbox)
+
+    def blit(self):
+        profile = Profiler.enabled
+        for display in self.displays:
+            if profile:
+                start = time.perf_counter_ns()
+
+            # backgrounds are captured lazily, only for invalidated displays
+            if display.background is None:
+                self.capture(display)
+                if profile:
+                    Profiler.count(f'capture.{type(display).__name__}')
+
+            canvas = display.fig.canvas
+            progressive = getattr(display, 'progressive', False)
+            for i, (bbox, artists) in enumerate(display.blit_regions()):
+                canvas.restore_region(display.background[i])
+                for artist in artists:
+                    display.fig.draw_artist(artist)
+
+                if progressive:
+                    display.background[i] = canvas.copy_from_bbox(bbox)
+
+                canvas.blit(bbox)
+
+            if profile:
+                Profiler.record(
+                    f'blit.{type(display).__name__}', time.perf_counter_ns() - start)
+
+        if self.displays:
+            self.displays[-1].fig.canvas.flush_events()
+
+    def __repr__(self):
+        return f'blit manager of {len(self.displays)} displays'
@@ -0,0 +1,338 @@
+''' module for an index of many dji mavic pro flight logs, with spatial,
+    temporal and statistics queries that do not read the csv files
+'''
+import os
+import argparse
+import sqlite3
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from dji_mavic_io import read_flightdata_csv
+from dji_simplify import simplify_track
+
+
+fleet_index_file = Path.home() / '.cache' / 'dji_mavic' / 'fleet.sqlite'
+track_tolerance = 5  # meter
+METER_PER_DEGREE = 111_320
+summary_columns = [
+    'time(millisecond)', 'datetime(utc)', 'latitude', 'longitude',
+    'max_altitude(feet)', 'max_speed(mph)', 'max_distance(feet)', 'battery_percent',
+]
+flight_fields = [
+    ('path', 'TEXT PRIMARY KEY'),
+    ('size', 'INTEGER'),
+    ('mtime_ns', 'INTEGER'),
+    ('rows', 'INTEGER'),
+    ('west', 'REAL'),
+    ('south', 'REAL'),
+    ('east', 'REAL'),
+    ('north', 'REAL'),
+    ('start_utc', 'TEXT'),
+    ('end_utc', 'TEXT'),
+    ('duration_s', 'REAL'),
+    ('max_altitude_ft', 'REAL'),
+    ('max_speed_mph', 'REAL'),
+    ('max_distance_ft', 'REAL'),
+    ('battery_start', 'REAL'),
+    ('battery_end', 'REAL'),
+    ('battery_used', 'REAL'),
+    ('track', 'BLOB'),
+]
+flight_keys = [key for key, _ in flight_fields]
+
+
+def parse_datetime_utc(value) -> pd.Timestamp:
+    ''' parse an Airdata datetime(utc) value, iso format or day first '''
+    try:
+        return pd.to_datetime(value, format='%Y-%m-%d %H:%M:%S')
+
+    except (ValueError, TypeError):
+        return pd.to_datetime(value, dayfirst=True)
+
+
+def get_local_xy(lats, lons, lat0, lon0):
+    ''' equirectangular projection in meter around (lat0, lon0), accurate
+        enough over the extent of a flight
+    '''
+    x = (lons - lon0) * METER_PER_DEGREE * np.cos(np.radians(lat0))
+    y = (lats - lat0) * METER_PER_DEGREE
+    return x, y
+
+
+def get_track(lats, lons) -> np.ndarray:
+    ''' simplified track as float32 (lat, lon) pairs, the points left out are
+        within track_tolerance of the track; non-finite points are dropped
+    '''
+    finite = np.isfinite(lats) & np.isfinite(lons)
+    if not finite.any():
+        return np.empty((0, 2), dtype=np.float32)
+
+    x, y = get_local_xy(lats, lons, np.mean(lats[finite]), np.mean(lons[finite]))
+    indices = simplify_track(x, y, tolerance=track_tolerance)
+    return np.column_stack((lats[indices], lons[indices])).astype(np.float32)
+
+
+def flight_summary(flightdata_df: pd.DataFrame) -> dict:
+    ''' summary of a flight for the index
+        argument:
+            flightdata_df: flightdata dataframe with at least summary_columns
+        returns:
+            dict of the flight_keys, without path, size and mtime_ns
+    '''
+    lats = flightdata_df['latitude'].to_numpy(dtype=np.float64)
+    lons = flightdata_df['longitude'].to_numpy(dtype=np.float64)
+    time_ms = flightdata_df['time(millisecond)'].to_numpy(dtype=np.float64)
+    battery = flightdata_df['battery_percent'].to_numpy(dtype=np.float64)
+    battery = battery[~np.isnan(battery)]
+    duration = (time_ms[-1] - time_ms[0]) / 1000
+    start = parse_datetime_utc(str(flightdata_df['datetime(utc)'].iloc[0]))
+    end = start + pd.Timedelta(seconds=duration)
+    return {
+        'rows': len(flightdata_df),
+        'west': float(np.nanmin(lons)),
+        'south': float(np.nanmin(lats)),
+        'east': float(np.nanmax(lons)),
+        'north': float(np.nanmax(lats)),
+        'start_utc': start.isoformat(),
+        'end_utc': end.isoformat(),
+        'duration_s': duration,
+        'max_altitude_ft': float(np.nanmax(flightdata_df['max_altitude(feet)'])),
+        'max_speed_mph': float(np.nanmax(flightdata_df['max_speed(mph)'])),
+        'max_distance_ft': float(np.nanmax(flightdata_df['max_distance(feet)'])),
+        'battery_start': float(battery[0]),
+        'battery_end': float(battery[-1]),
+        'battery_used': float(battery[0] - battery[-1]),
+        'track': get_track(lats, lons).tobytes(),
+    }
+
+
+def get_track_distance(track, lat, lon) -> float:
+    ''' distance in meter from (lat, lon) to the nearest segment of track,
+        nan for a track without finite points
+    '''
+    x, y = get_local_xy(track[:, 0], track[:, 1], lat, lon)
+    points = np.column_stack((x, y))
+    points = points[np.all(np.isfinite(points), axis=1)]
+    if len(points) == 0:
+        return np.nan
+
+    if len(points) == 1:
+        return float(np.hypot(*points[0]))
+
+    a, ab = points[:-1], np.diff(points, axis=0)
+    length2 = np.einsum('ij,ij->i', ab, ab)
+    t = np.clip(
+        -np.einsum('ij,ij->i', a, ab) / np.where(length2 > 0, length2, 1), 0.0, 1.0)
+    d = a + t[:, None] * ab
+    return float(np.nanmin(np.hypot(d[:, 0], d[:, 1])))
+
+
+def get_like_prefix(folder) -> str:
+    ''' LIKE pattern for the paths in folder, with the separator so sibling
+        folders with the same start do not match and with the LIKE
+        wildcards in the folder name escaped
+    '''
+    prefix = str(folder).rstrip(os.sep) + os.sep
+    for char in ['\\', '%', '_']:
+        prefix = prefix.replace(char, f'\\{char}')
+
+    return f'{prefix}%'
+
+
+class FleetIndex:
+    ''' sqlite index of flight logs with per flight bounding box, start and
+        end time, duration, maximum altitude, speed and distance, battery
+        use and a simplified track
+        methods:
+            update: index new and changed csv files of a folder
+            add_flight: index one csv file
+            add_summary: store a flight summary
+            query: flights matching bbox, distance to a point, time and stats
+            get_track: simplified track of an indexed flight
+    '''
+
+    def __init__(self, index_file=fleet_index_file):
+        self.index_file = Path(index_file)
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.index_file))
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS flights ('
+            + ', '.join(f'{key} {field}' for key, field in flight_fields) + ')')
+        self.db.execute('CREATE INDEX IF NOT EXISTS flights_start ON flights (start_utc)')
+        self.db.commit()
+
+    def update(self, folder, pattern='**/*.csv') -> tuple:
+        ''' index new and changed csv files in folder and remove flights of
+            files that no longer exist
+            returns:
+                number of added or updated flights, number of removed flights
+        '''
+        folder = Path(folder).resolve()
+        indexed = {
+            path: (size, mtime_ns) for path, size, mtime_ns in self.db.execute(
+                "SELECT path, size, mtime_ns FROM flights WHERE path LIKE ? ESCAPE '\\'",
+                (get_like_prefix(folder),))
+        }
+        updated = 0
+        found = set()
+        for file_name in sorted(folder.glob(pattern)):
+            path = str(file_name)
+            found.add(path)
+            stat = file_name.stat()
+            if indexed.get(path) == (stat.st_size, stat.st_mtime_ns):
+                continue
+
+            if self.add_flight(file_name, commit=False):
+                updated += 1
+
+        removed = [(path,) for path in indexed if path not in found]
+        self.db.executemany('DELETE FROM flights WHERE path=?', removed)
+        self.db.commit()
+        return updated, len(removed)
+
+    def add_flight(self, file_name, commit=True) -> bool:
+        file_name = Path(file_name).resolve()
+        flightdata_df = read_flightdata_csv(file_name, columns=summary_columns)
+        if flightdata_df.empty:
+            return False
+
+        try:
+            summary = flight_summary(flightdata_df)
+
+        except (ValueError, KeyError, IndexError) as e:
+            print(f'unable to summarize {file_name}, error message: {e}')
+            return False
+
+        stat = file_name.stat()
+        self.add_summary(str(file_name), stat.st_size, stat.st_mtime_ns, summary)
+        if commit:
+            self.db.commit()
+
+        return True
+
+    def add_summary(self, path, size, mtime_ns, summary):
+        values = {'path': path, 'size': size, 'mtime_ns': mtime_ns, **summary}
+        self.db.execute(
+            f'INSERT OR REPLACE INTO flights ({", ".join(flight_keys)}) '
+            f'VALUES ({", ".join("?" * len(flight_keys))})',
+            [values[key] for key in flight_keys])
+
+    def query(self, bbox=None, near=None, start=None, end=None, stats=None) -> pd.DataFrame:
+        ''' flights matching all given conditions
+            arguments:
+                bbox: (west, south, east, north), flights overlapping the box
+                near: (lat, lon, radius in meter), flights with the track
+                      passing within radius of the point
+                start, end: flights overlapping the period, iso date strings
+                stats: dict of key: (min, max) for numeric flight keys, use
+                       None for an open bound
+            returns:
+                dataframe of flights without the track
+        '''
+        conditions, parameters = [], []
+        if near:
+            lat, lon, radius = near
+            dlat = radius / METER_PER_DEGREE
+            dlon = radius / (METER_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+            near_bbox = (lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+            bbox = near_bbox if bbox is None else (
+                max(bbox[0], near_bbox[0]), max(bbox[1], near_bbox[1]),
+                min(bbox[2], near_bbox[2]), min(bbox[3], near_bbox[3]),
+            )
+
+        if bbox:
+            conditions += ['east >= ?', 'west <= ?', 'north >= ?', 'south <= ?']
+            parameters += [bbox[0], bbox[2], bbox[1], bbox[3]]
+
+        if start:
+            conditions.append('end_utc >= ?')
+            parameters.append(pd.Timestamp(start).isoformat())
+
+        if end:
+            conditions.append('start_utc < ?')
+            parameters.append(pd.Timestamp(end).isoformat())
+
+        for key, (min_value, max_value) in (stats or {}).items():
+            if key not in flight_keys:
+                raise ValueError(f'unknown flight key: {key}')
+
+            if min_value is not None:
+                conditions.append(f'{key} >= ?')
+                parameters.append(min_value)
+
+            if max_value is not None:
+                conditions.append(f'{key} <= ?')
+                parameters.append(max_value)
+
+        sql = 'SELECT * FROM flights'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+
+        flights_df = pd.read_sql_query(sql + ' ORDER BY start_utc', self.db, params=parameters)
+        if near and not flights_df.empty:
+            within = [
+                get_track_distance(track, near[0], near[1]) <= near[2]
+                for track in (
+                    np.frombuffer(blob, dtype=np.float32).reshape(-1, 2).astype(np.float64)
+                    for blob in flights_df['track'])
+            ]
+            flights_df = flights_df[within].reset_index(drop=True)
+
+        return flights_df.drop(columns='track')
+
+    def get_track(self, path) -> np.ndarray:
+        row = self.db.execute('SELECT track FROM flights WHERE path=?', (str(path),)).fetchone()
+        if not row:
+            return None
+
+        return np.frombuffer(row[0], dtype=np.float32).reshape(-1, 2)
+
+    def close(self):
+        self.db.close()
+
+    def __repr__(self):
+        flights, = self.db.execute('SELECT COUNT(*) FROM flights').fetchone()
+        return f'fleet index {self.index_file}: {flights:,} flights'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='index and query flight logs')
+    parser.add_argument('--index', default=fleet_index_file, help='index file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    update_parser = subparsers.add_parser('update', help='index new and changed logs')
+    update_parser.add_argument('folder')
+    query_parser = subparsers.add_parser('query', help='query the index')
+    query_parser.add_argument(
+        '--bbox', type=float, nargs=4, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'))
+    query_parser.add_argument(
+        '--near', type=float, nargs=3, metavar=('LAT', 'LON', 'RADIUS_M'))
+    query_parser.add_argument('--start', help='e.g. 2017-08-01')
+    query_parser.add_argument('--end', help='e.g. 2017-09-01')
+    query_parser.add_argument(
+        '--stat', nargs=3, action='append', default=[], metavar=('KEY', 'MIN', 'MAX'),
+        help='numeric flight key with min and max, use - for an open bound')
+    args = parser.parse_args()
+
+    fleet_index = FleetIndex(args.index)
+    if args.command == 'update':
+        updated, removed = fleet_index.update(args.folder)
+        print(f'updated {updated} flights, removed {removed} flights')
+
+    elif args.command == 'query':
+        stats = {
+            key: tuple(None if v == '-' else float(v) for v in (min_value, max_value))
+            for key, min_value, max_value in args.stat
+        }
+        flights_df = fleet_index.query(
+            bbox=args.bbox, near=args.near, start=args.start, end=args.end, stats=stats)
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(flights_df[[
+                'path', 'start_utc', 'duration_s', 'max_altitude_ft', 'max_speed_mph',
+                'max_distance_ft', 'battery_used',
+            ]])
+
+    print(fleet_index)
+
+
+if __name__ == '__main__':
+    main()
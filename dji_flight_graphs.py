@@ -3,71 +3,94 @@
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
-from dji_mavic_io import read_flightdata_csv
+from dji_mavic_io import read_flightdata_csv, FEET_METER_CONV, MILES_KM_CONV
+from dji_lod import LodTrace
+from dji_resample import resample_flightdata
+from utils.plogger import profiled
+from dji_blit import BlitManager
+from dji_live import expand_limits, live_window
 
 
-FEET_METER_CONV = 0.3048
-MILES_KM_CONV = 1.60934
 fig_size = (8, 4)
 graph_light_color = 'lightgrey'
 graph_dark_color = 'black'
 graph_lw = 0.5
 graph_xlabel = 'time (s)'
+default_lod_bins = 800
+max_segment = 200  # samples, longer jumps are drawn as a seek
 
 
 class GraphDisplay:
     ''' display of graphs for height, speed and distance
         methods:
             setup_graphs: setup for graphs for height, speed and distance
+            set_lod: decimate the traces to the width of the axes in pixels
             draw: initial draw
             update: update graph values
+            seek: jump to a sample without drawing the samples in between
+            draw_background: draw the trace so far in the background (incremental)
+            blit_regions: regions and animated artists for the blit manager
             blit: blit the graphs
             on_resize: redraws graphs on resize
+            set_live: switch to a sliding window of a live feed
+            update_window: show the samples of the sliding window
+        with incremental=True each frame draws only the samples since the
+        previous frame on top of a progressive background per axes that
+        keeps the trace so far
     '''
+    flightdata_columns = [
+        'time(millisecond)', 'height_above_takeoff(feet)', 'speed(mph)', 'distance(feet)',
+    ]
 
-    def __init__(self, flightdata_df):
+    def __init__(self, flightdata_df, incremental=False):
         mpl.rcParams['toolbar'] = 'None'
         self.fig, (self.ax_height, self.ax_speed, self.ax_dist) = plt.subplots(
             nrows=3, ncols=1, figsize=fig_size, sharex='all')
         self.fig.canvas.set_window_title('Flight graphs')
         self.fig.suptitle(None)
         self.background = None
+        self.incremental = incremental
+        self.progressive = incremental
+        self.drawn_index = 0
+        self.clean_background = None
+        self.live = False
 
         # self.fig.tight_layout()
         self.setup_graphs(flightdata_df)
 
         connect = self.fig.canvas.mpl_connect
         connect('resize_event', self.on_resize)
+        self.blit_manager = BlitManager([self])
 
     def setup_graphs(self, flightdata_df):
-        self.fl_time = np.array(
-            flightdata_df['time(millisecond)'].to_list(), dtype=np.float64) / 1000
-        self.fl_height = np.array(
-            flightdata_df['height_above_takeoff(feet)'].to_list(), dtype=np.float64)
-        self.fl_speed = np.array(
-            flightdata_df['speed(mph)'].to_list(), dtype=np.float64) * MILES_KM_CONV
-        self.fl_dist = np.array(
-            flightdata_df['distance(feet)'].to_list(), dtype=np.float64) * FEET_METER_CONV
+        self.fl_time = flightdata_df['time(millisecond)'].to_numpy(
+            dtype=np.float64) / 1000
+        self.fl_height = flightdata_df['height_above_takeoff(feet)'].to_numpy(
+            dtype=np.float64)
+        self.fl_speed = flightdata_df['speed(mph)'].to_numpy(
+            dtype=np.float64) * MILES_KM_CONV
+        self.fl_dist = flightdata_df['distance(feet)'].to_numpy(
+            dtype=np.float64) * FEET_METER_CONV
 
         # height graph
-        self.ax_height.plot(
-            self.fl_time, self.fl_height, color=graph_light_color, linewidth=graph_lw,)
+        self.bg_height, = self.ax_height.plot(
+            [0], [0], color=graph_light_color, linewidth=graph_lw,)
         self.graph_height, = self.ax_height.plot(
             [0], [0], color=graph_dark_color, linewidth=graph_lw, animated=True,)
         self.ax_height.set_ylim(min(self.fl_height)*1.1, max(self.fl_height)*1.1)
         self.ax_height.set_ylabel('Height\n(feet)')
 
         # speed graph
-        self.ax_speed.plot(
-            self.fl_time, self.fl_speed, color=graph_light_color, linewidth=graph_lw,)
+        self.bg_speed, = self.ax_speed.plot(
+            [0], [0], color=graph_light_color, linewidth=graph_lw,)
         self.graph_speed, = self.ax_speed.plot(
             [0], [0], color=graph_dark_color, linewidth=graph_lw, animated=True,)
         self.ax_speed.set_ylim(min(self.fl_speed)*1.1, max(self.fl_speed)*1.1)
         self.ax_speed.set_ylabel('Speed\n(km/ hour)')
 
         # distance graph
-        _ = self.ax_dist.plot(
-            self.fl_time, self.fl_dist, color=graph_light_color, linewidth=graph_lw,)
+        self.bg_dist, = self.ax_dist.plot(
+            [0], [0], color=graph_light_color, linewidth=graph_lw,)
         self.graph_dist, = self.ax_dist.plot(
             [0], [0], color=graph_dark_color, linewidth=graph_lw, animated=True,)
         self.ax_dist.set_ylim(min(self.fl_dist)*1.1, max(self.fl_dist)*1.1)
@@ -76,38 +99,146 @@ class GraphDisplay:
         # add the time axis
         self.ax_dist.set_xlabel(graph_xlabel)
         self.ax_dist.set_xlim(0, max(self.fl_time))
+        self.set_lod()
+
+    def set_lod(self):
+        ''' decimate the background and animated traces to the width of the
+            axes in pixels, so the cost of a frame does not grow with the
+            length of the flight
+        '''
+        n_bins = int(self.ax_height.get_window_extent().width) or default_lod_bins
+        self.lod_height = LodTrace(self.fl_time, self.fl_height, n_bins)
+        self.lod_speed = LodTrace(self.fl_time, self.fl_speed, n_bins)
+        self.lod_dist = LodTrace(self.fl_time, self.fl_dist, n_bins)
+        self.bg_height.set_data(*self.lod_height.full())
+        self.bg_speed.set_data(*self.lod_speed.full())
+        self.bg_dist.set_data(*self.lod_dist.full())
+        self.traces = [
+            (self.ax_height, self.graph_height, self.fl_height, self.lod_height),
+            (self.ax_speed, self.graph_speed, self.fl_speed, self.lod_speed),
+            (self.ax_dist, self.graph_dist, self.fl_dist, self.lod_dist),
+        ]
 
     def draw(self):
         self.fig.canvas.draw()
         self.fig.canvas.flush_events()
 
+    @profiled('update.GraphDisplay')
     def update(self, index):
-        self.graph_height.set_data(self.fl_time[:index], self.fl_height[:index],)
-        self.graph_speed.set_data(self.fl_time[:index], self.fl_speed[:index],)
-        self.graph_dist.set_data(self.fl_time[:index], self.fl_dist[:index],)
+        if self.incremental:
+            # segment from the last drawn sample, going back or a long jump
+            # forward redraws the decimated trace up to index
+            if index < self.drawn_index or index - self.drawn_index > max_segment:
+                self.seek(index)
+
+            start = max(self.drawn_index - 1, 0)
+            for _, graph, values, _ in self.traces:
+                graph.set_data(self.fl_time[start:index], values[start:index])
+
+            self.drawn_index = index
+
+        else:
+            self.graph_height.set_data(*self.lod_height.prefix(index))
+            self.graph_speed.set_data(*self.lod_speed.prefix(index))
+            self.graph_dist.set_data(*self.lod_dist.prefix(index))
 
         return (
             self.fl_time[index], self.fl_height[index],
             self.fl_speed[index], self.fl_dist[index],
         )
 
-    def blit(self):
-        if self.background is None:
-            self.background = (
-                self.fig.canvas.copy_from_bbox(self.fig.bbox)
-            )
-            self.draw()
+    def seek(self, index):
+        ''' set the trace to end at index, the work is bounded by the width
+            of the axes in pixels and not by the length of the flight, as
+            the decimated trace is drawn on the clean background captured
+            with the last full draw
+        '''
+        self.drawn_index = index
+        if not self.incremental or self.background is None or self.clean_background is None:
+            return
 
-        else:
-            self.fig.canvas.restore_region(self.background)
-            self.fig.draw_artist(self.graph_height)
-            self.fig.draw_artist(self.graph_speed)
-            self.fig.draw_artist(self.graph_dist)
-            self.fig.canvas.blit()
-            self.fig.canvas.flush_events()
+        canvas = self.fig.canvas
+        for i, (ax, graph, _, lod) in enumerate(self.traces):
+            canvas.restore_region(self.clean_background[i])
+            graph.set_data(*lod.prefix(index))
+            ax.draw_artist(graph)
+            graph.set_data([], [])
+            self.background[i] = canvas.copy_from_bbox(ax.bbox)
+
+    def draw_background(self):
+        if not self.incremental:
+            return
+
+        # after a full draw the decimated trace so far becomes the
+        # background, the clean background without the trace is kept for seek
+        canvas = self.fig.canvas
+        self.clean_background = [canvas.copy_from_bbox(ax.bbox) for ax, _, _, _ in self.traces]
+        for ax, graph, _, lod in self.traces:
+            graph.set_data(*lod.prefix(self.drawn_index))
+            ax.draw_artist(graph)
+            # the trace is in the background now, it must not be drawn again
+            graph.set_data([], [])
+
+    def set_live(self, window=live_window):
+        ''' live mode: the graphs show the last window seconds of a feed,
+            the limits are not set from the whole flight but grow with the
+            samples, and the time axis moves forward by half a window
+        '''
+        self.live = True
+        self.incremental = False
+        self.progressive = False
+        self.window = window
+        self.limits = [None] * len(self.traces)
+        for bg_line in [self.bg_height, self.bg_speed, self.bg_dist]:
+            bg_line.set_data([], [])
+
+        self.ax_dist.set_xlim(0, window)
+        self.background = None
+
+    @profiled('update.GraphDisplay')
+    def update_window(self, time_s, height, speed, dist):
+        ''' show the samples of the sliding window, height in feet, speed in
+            km/h and distance in meter; a change of limits redraws the
+            background with the next blit
+            returns:
+                time, height, speed, distance of the last sample
+        '''
+        if len(time_s) == 0:
+            return None
+
+        xmin, xmax = self.ax_dist.get_xlim()
+        if time_s[-1] > xmax or time_s[-1] < xmin:
+            xmin = max(time_s[-1] - 0.5 * self.window, 0)
+            self.ax_dist.set_xlim(xmin, xmin + self.window)
+            self.background = None
+
+        for i, (ax, graph, values) in enumerate([
+                (self.ax_height, self.graph_height, height),
+                (self.ax_speed, self.graph_speed, speed),
+                (self.ax_dist, self.graph_dist, dist)]):
+            graph.set_data(time_s, values)
+            limits = expand_limits(self.limits[i], np.nanmin(values), np.nanmax(values))
+            if limits:
+                self.limits[i] = limits
+                ax.set_ylim(*limits)
+                self.background = None
+
+        return time_s[-1], height[-1], speed[-1], dist[-1]
+
+    def blit_regions(self):
+        if self.incremental:
+            return [(ax.bbox, [graph]) for ax, graph, _, _ in self.traces]
+
+        return [(self.fig.bbox, [self.graph_height, self.graph_speed, self.graph_dist])]
+
+    def blit(self):
+        self.blit_manager.blit()
 
     def on_resize(self, event):
         self.background = None
+        self.clean_background = None
+        if not self.live:
+            self.set_lod()
 
     def remove_fig(self):
         plt.close(self.fig)
@@ -117,15 +248,16 @@ class GraphDisplay:
 
 
 if __name__ == '__main__':
-    samplerate = 5
-    flightdata_df = read_flightdata_csv('dji_mavic_test_data.csv')
+    rate = 2  # Hz
+    flightdata_df = resample_flightdata(read_flightdata_csv(
+        'dji_mavic_test_data.csv', columns=GraphDisplay.flightdata_columns), rate=rate)
     gd = GraphDisplay(flightdata_df)
     plt.show(block=False)
     plt.pause(0.1)
     print(gd)
     input('continue to start ...')
 
-    for i in range(0, len(flightdata_df), samplerate):
+    for i in range(len(flightdata_df)):
         gd.update(i)
         gd.blit()
 
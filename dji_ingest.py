@@ -0,0 +1,164 @@
+''' module for parallel bulk ingest of dji mavic pro flight logs to
+    columnar output with per flight summaries
+'''
+import sys
+import glob
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from dji_mavic_io import (
+    flightdata_keys, parse_flightdata_csv, fix_initial_gps, write_flightdata_cache,
+)
+from dji_fleet import flight_summary
+
+
+summaries_file = 'summaries.csv'
+
+
+def validate_header(file_name) -> list:
+    ''' check the header of a csv against flightdata_keys
+        returns:
+            list of missing keys, extra columns are allowed
+    '''
+    with open(file_name, encoding='utf-8', errors='replace') as f:
+        header = f.readline().rstrip('\r\n').split(',')
+
+    return [key for key in flightdata_keys if key not in header]
+
+
+def get_output_name(file_name) -> str:
+    ''' output folder name, the file stem with a hash of the full path so
+        files with the same name in different folders do not collide
+    '''
+    file_name = Path(file_name).resolve()
+    return f'{file_name.stem}_{hashlib.sha1(str(file_name).encode()).hexdigest()[:8]}'
+
+
+def ingest_file(file_name, output_dir) -> dict:
+    ''' parse, validate and write one log, errors are returned and do not
+        raise, so a bad file does not stop the batch
+        arguments:
+            file_name: csv filename
+            output_dir: folder for the columnar output
+        returns:
+            dict with file, output, rows, bytes, seconds, error and summary
+    '''
+    start = time.perf_counter()
+    file_name = Path(file_name)
+    result = {
+        'file': str(file_name), 'output': None, 'rows': 0, 'bytes': 0,
+        'seconds': 0.0, 'error': None, 'summary': None,
+    }
+    try:
+        result['bytes'] = file_name.stat().st_size
+        missing_keys = validate_header(file_name)
+        if missing_keys:
+            raise ValueError(
+                f'missing {len(missing_keys)} columns: {", ".join(missing_keys[:5])}')
+
+        flightdata_df = parse_flightdata_csv(file_name)
+        if flightdata_df.empty:
+            raise ValueError('no flightdata')
+
+        fix_initial_gps(flightdata_df)
+        summary = flight_summary(flightdata_df)
+        summary['track'] = np.frombuffer(
+            summary['track'], dtype=np.float32).reshape(-1, 2).tolist()
+
+        output_path = Path(output_dir) / get_output_name(file_name)
+        shutil.rmtree(output_path, ignore_errors=True)
+        write_flightdata_cache(flightdata_df, output_path)
+        with open(output_path / 'summary.json', 'w') as f:
+            json.dump({'file': str(file_name), **summary}, f)
+
+        result['output'] = str(output_path)
+        result['rows'] = len(flightdata_df)
+        result['summary'] = {key: value for key, value in summary.items() if key != 'track'}
+
+    except Exception as e:  #pylint: disable=broad-except
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def get_flight_files(path_or_glob) -> list:
+    ''' csv files of a folder (recursive) or a glob pattern '''
+    path = Path(path_or_glob)
+    if path.is_dir():
+        return sorted(path.glob('**/*.csv'))
+
+    return sorted(Path(file_name) for file_name in glob.glob(str(path_or_glob), recursive=True))
+
+
+def ingest(path_or_glob, output_dir, workers=None) -> dict:
+    ''' ingest all logs of a folder or glob pattern in a process pool
+        arguments:
+            path_or_glob: folder or glob pattern of csv files
+            output_dir: folder for the columnar output and summaries.csv
+            workers: number of processes, None for the number of cores
+        returns:
+            dict with results per file and totals of rows, bytes, seconds,
+            rows/s and MB/s
+    '''
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    flight_files = get_flight_files(path_or_glob)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            ingest_file, flight_files, [output_dir] * len(flight_files)))
+
+    seconds = time.perf_counter() - start
+
+    summaries = [
+        {'file': result['file'], 'output': result['output'], **result['summary']}
+        for result in results if not result['error']
+    ]
+    pd.DataFrame(summaries).to_csv(output_dir / summaries_file, index=False)
+
+    rows = sum(result['rows'] for result in results if not result['error'])
+    n_bytes = sum(result['bytes'] for result in results if not result['error'])
+    return {
+        'results': results,
+        'files': len(results),
+        'failed': sum(1 for result in results if result['error']),
+        'rows': rows,
+        'bytes': n_bytes,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else 0.0,
+        'mb_per_second': n_bytes / 1024**2 / seconds if seconds else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='bulk ingest of flight logs')
+    parser.add_argument('path', help='folder or glob pattern of csv files')
+    parser.add_argument('--output-dir', default='ingested')
+    parser.add_argument('--workers', type=int, default=None, help='default number of cores')
+    args = parser.parse_args()
+
+    report = ingest(args.path, args.output_dir, workers=args.workers)
+    for result in report['results']:
+        if result['error']:
+            print(f'{result["file"]}: error: {result["error"]}')
+
+    print(
+        f'ingested {report["files"] - report["failed"]} of {report["files"]} files, '
+        f'{report["rows"]:,} rows, {report["bytes"] / 1024**2:.1f} MB in '
+        f'{report["seconds"]:.1f} s: {report["rows_per_second"]:,.0f} rows/s, '
+        f'{report["mb_per_second"]:.1f} MB/s'
+    )
+    if report['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,463 @@
+''' module for live telemetry of dji mavic pro flights, Airdata style csv
+    rows arrive over udp, tcp or a pipe and are kept in preallocated ring
+    buffers, so memory stays the same however long the feed runs
+'''
+import io
+import os
+import csv
+import sys
+import time
+import socket
+import argparse
+import threading
+from collections import deque
+from urllib.parse import urlparse
+import psutil
+import numpy as np
+import pandas as pd
+from dji_mavic_io import flightdata_keys
+
+
+default_url = 'udp://127.0.0.1:5005'
+default_capacity = 6_000  # samples, 10 minutes at 10 Hz
+live_window = 120  # seconds of flight shown by the displays
+restart_time = 10  # seconds, time going back more than this starts a new flight
+limit_margin = 0.1  # expanded limits get this fraction of the span as headroom
+socket_timeout = 0.5  # seconds, how often a blocked reader checks for stop
+max_datagram = 65_507
+replay_file = 'dji_mavic_test_data.csv'
+live_columns = [
+    'time(millisecond)', 'latitude', 'longitude', 'height_above_takeoff(feet)',
+    'speed(mph)', 'distance(feet)', 'rc_elevator', 'rc_aileron', 'rc_throttle',
+    'rc_rudder',
+]
+
+
+def expand_limits(limits, low, high, margin=limit_margin):
+    ''' limits grown to hold low and high, a grown side gets margin times
+        the new span as headroom, so a value that keeps rising changes the
+        limits now and then and not every frame
+        returns:
+            (lower, upper), or None if the limits already hold low and high
+    '''
+    if not (np.isfinite(low) and np.isfinite(high)):
+        return None
+
+    if limits is None:
+        lower, upper = low, high
+        grow_lower = grow_upper = True
+
+    else:
+        lower, upper = limits
+        grow_lower, grow_upper = low < lower, high > upper
+        if not (grow_lower or grow_upper):
+            return None
+
+        lower, upper = min(lower, low), max(upper, high)
+
+    headroom = margin * max(upper - lower, 1.0)
+    return (
+        lower - headroom if grow_lower else lower,
+        upper + headroom if grow_upper else upper,
+    )
+
+
+class RingBuffer:
+    ''' preallocated float64 ring buffer per channel, each sample is written
+        twice, at i and i + capacity, so the last n samples are always a
+        contiguous view and reading a window does not copy
+        methods:
+            extend: append samples, the oldest are overwritten when full
+            clear: remove all samples
+            get_window: views of the last n samples per channel
+            get_time_window: views of the samples of the last duration seconds
+            get_last: the last sample as a dict
+            to_frame: dataframe of the samples in the buffer
+    '''
+
+    def __init__(self, channels, capacity=default_capacity, time_key='time(millisecond)'):
+        self.capacity = capacity
+        self.time_key = time_key
+        self.channels = {
+            channel: np.full(2 * capacity, np.nan) for channel in channels
+        }
+        self.head = 0  # position of the next sample
+        self.size = 0
+        self.total = 0  # samples appended since the start
+
+    def extend(self, values):
+        ''' arguments:
+                values: dict of channel: array, all of the same length
+        '''
+        n_samples = len(next(iter(values.values())))
+        if n_samples == 0:
+            return
+
+        # of a batch longer than the buffer only the last capacity samples stay
+        skip = max(n_samples - self.capacity, 0)
+        head = (self.head + skip) % self.capacity
+        index = (head + np.arange(n_samples - skip)) % self.capacity
+        for channel, buffer in self.channels.items():
+            new_values = np.asarray(values[channel], dtype=np.float64)[skip:]
+            buffer[index] = new_values
+            buffer[index + self.capacity] = new_values
+
+        self.head = (self.head + n_samples) % self.capacity
+        self.size = min(self.size + n_samples, self.capacity)
+        self.total += n_samples
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def get_window(self, n_samples=None) -> dict:
+        n_samples = self.size if n_samples is None else min(n_samples, self.size)
+        end = self.head + self.capacity
+        return {
+            channel: buffer[end - n_samples:end] for channel, buffer in self.channels.items()
+        }
+
+    def get_time_window(self, duration) -> dict:
+        ''' samples of the last duration seconds, assumes the samples arrive
+            in time order
+        '''
+        window = self.get_window()
+        time_ms = window[self.time_key]
+        if len(time_ms) == 0:
+            return window
+
+        start = np.searchsorted(time_ms, time_ms[-1] - 1000 * duration, side='left')
+        return {channel: values[start:] for channel, values in window.items()}
+
+    def get_last(self) -> dict:
+        if self.size == 0:
+            return {}
+
+        index = self.head + self.capacity - 1
+        return {channel: buffer[index] for channel, buffer in self.channels.items()}
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            channel: values.copy() for channel, values in self.get_window().items()})
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return (f'ring buffer of {len(self.channels)} channels: {self.size:,} of '
+                f'{self.capacity:,} samples, {self.total:,} received')
+
+
+def parse_url(url) -> tuple:
+    ''' url as (scheme, host, port), '-' or pipe: is stdin '''
+    if url in ['-', 'pipe:']:
+        return 'pipe', None, None
+
+    parsed = urlparse(url)
+    if parsed.scheme not in ['udp', 'tcp']:
+        raise ValueError(f'url must be udp://host:port, tcp://host:port or -, not {url}')
+
+    return parsed.scheme, parsed.hostname or '127.0.0.1', parsed.port
+
+
+def udp_lines(host, port, stop):
+    ''' lines of the datagrams received on host, port until stop is set '''
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((host, port))
+        sock.settimeout(socket_timeout)
+        while not stop.is_set():
+            try:
+                data, _ = sock.recvfrom(max_datagram)
+
+            except socket.timeout:
+                continue
+
+            yield from data.decode('utf-8', errors='replace').splitlines()
+
+
+def tcp_lines(host, port, stop):
+    ''' lines from a tcp server at host, port until stop is set or the
+        server closes the connection
+    '''
+    with socket.create_connection((host, port), timeout=socket_timeout) as sock:
+        pending = b''
+        while not stop.is_set():
+            try:
+                data = sock.recv(max_datagram)
+
+            except socket.timeout:
+                continue
+
+            if not data:
+                break
+
+            *lines, pending = (pending + data).split(b'\n')
+            for line in lines:
+                yield line.decode('utf-8', errors='replace').rstrip('\r')
+
+
+def pipe_lines(stream, stop):
+    for line in stream:
+        if stop.is_set():
+            break
+
+        yield line.rstrip('\r\n')
+
+
+class LiveFeed:
+    ''' reads Airdata csv rows from udp, tcp or a pipe in a thread, the rows
+        wait in a bounded queue until they are moved into a ring buffer by
+        the gui thread, so a stalled gui drops the oldest rows and does not
+        grow memory
+        a header row sets the column order, without a header the order of
+        flightdata_keys is assumed
+        methods:
+            start: start reading in a thread
+            stop: stop reading
+            get_rows: take the queued rows
+    '''
+
+    def __init__(self, url=default_url, columns=None, capacity=default_capacity, stream=None):
+        self.url = url
+        self.columns = columns or live_columns
+        self.stream = stream or sys.stdin
+        self.queue = deque(maxlen=capacity)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.column_index = self.get_column_index(flightdata_keys)
+        self.rows = 0
+        self.bad_rows = 0
+        self.error = None
+
+    def get_column_index(self, header) -> list:
+        header = [key.strip() for key in header]
+        return [header.index(column.strip()) for column in self.columns]
+
+    def parse_line(self, line):
+        ''' values of the columns in a csv line, None for a header or a
+            line that cannot be parsed
+        '''
+        if not line.strip():
+            return None
+
+        fields = next(csv.reader(io.StringIO(line)))
+        if fields[0].strip() == flightdata_keys[0]:
+            try:
+                self.column_index = self.get_column_index(fields)
+
+            except ValueError as e:
+                print(f'unable to use header, error message: {e}')
+
+            return None
+
+        try:
+            return tuple(
+                float(fields[i]) if fields[i].strip() else np.nan for i in self.column_index)
+
+        except (IndexError, ValueError):
+            self.bad_rows += 1
+            return None
+
+    def get_lines(self):
+        scheme, host, port = parse_url(self.url)
+        if scheme == 'udp':
+            return udp_lines(host, port, self.stop_event)
+
+        if scheme == 'tcp':
+            return tcp_lines(host, port, self.stop_event)
+
+        return pipe_lines(self.stream, self.stop_event)
+
+    def read(self):
+        try:
+            for line in self.get_lines():
+                row = self.parse_line(line)
+                if row is not None:
+                    self.queue.append(row)
+                    self.rows += 1
+
+        except OSError as e:
+            self.error = str(e)
+            print(f'unable to read {self.url}, error message: {e}')
+
+    def start(self):
+        self.thread = threading.Thread(target=self.read, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get_rows(self) -> dict:
+        ''' take the queued rows
+            returns:
+                dict of column: array of the rows, the arrays are empty if
+                there are no rows
+        '''
+        rows = []
+        while self.queue:
+            rows.append(self.queue.popleft())
+
+        values = np.array(rows, dtype=np.float64).reshape(-1, len(self.columns))
+        return {column: values[:, i] for i, column in enumerate(self.columns)}
+
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def __repr__(self):
+        return (f'live feed {self.url}: {self.rows:,} rows, {self.bad_rows:,} bad, '
+                f'{len(self.queue):,} queued')
+
+
+class ReplayServer:
+    ''' plays back an Airdata csv over udp or tcp at speed times the pace
+        of time(millisecond), to test the live mode with a recorded flight
+        with udp the rows are sent to the url, with tcp the server listens
+        on the url and plays back to each client that connects
+        methods:
+            start: start playback in a thread
+            stop: stop playback
+            serve: playback in the calling thread
+    '''
+
+    def __init__(self, file_name=replay_file, url=default_url, speed=1, loop=False):
+        self.file_name = file_name
+        self.url = url
+        self.speed = speed
+        self.loop = loop
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.rows_sent = 0
+
+    def get_rows(self):
+        ''' yields (time in seconds from the first row, line) of the rows,
+            the header has time 0
+        '''
+        with open(self.file_name, encoding='utf-8', errors='replace') as f:
+            yield 0.0, f.readline().rstrip('\r\n')
+            first_ms = None
+            for line in f:
+                line = line.rstrip('\r\n')
+                try:
+                    time_ms = float(line.split(',', 1)[0])
+
+                except ValueError:
+                    continue
+
+                first_ms = time_ms if first_ms is None else first_ms
+                yield (time_ms - first_ms) / 1000, line
+
+    def play(self, send):
+        ''' send the rows with send(line) at their time, returns False if
+            stopped
+        '''
+        while True:
+            start = time.perf_counter()
+            for row_time, line in self.get_rows():
+                delay = row_time / self.speed - (time.perf_counter() - start)
+                if self.stop_event.wait(max(delay, 0)):
+                    return False
+
+                send(line)
+                self.rows_sent += 1
+
+            if not self.loop:
+                return True
+
+    def serve_udp(self, host, port):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            self.play(lambda line: sock.sendto(f'{line}\n'.encode(), (host, port)))
+
+    def serve_tcp(self, host, port):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((host, port))
+            server.listen(1)
+            server.settimeout(socket_timeout)
+            while not self.stop_event.is_set():
+                try:
+                    connection, _ = server.accept()
+
+                except socket.timeout:
+                    continue
+
+                with connection:
+                    try:
+                        if not self.play(lambda line: connection.sendall(f'{line}\n'.encode())):
+                            return
+
+                    except OSError as e:
+                        print(f'client disconnected, error message: {e}')
+
+    def serve(self):
+        scheme, host, port = parse_url(self.url)
+        if scheme == 'udp':
+            self.serve_udp(host, port)
+
+        elif scheme == 'tcp':
+            self.serve_tcp(host, port)
+
+        else:
+            self.play(lambda line: print(line, flush=True))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def __repr__(self):
+        return f'replay of {self.file_name} to {self.url} at {self.speed}x'
+
+
+def monitor(url, capacity=default_capacity, interval=1.0):
+    ''' print the last sample and the memory use of a live feed, without
+        displays
+    '''
+    feed = LiveFeed(url, capacity=capacity)
+    ring_buffer = RingBuffer(feed.columns, capacity=capacity)
+    process = psutil.Process(os.getpid())
+    feed.start()
+    try:
+        while feed.running() or feed.queue:
+            time.sleep(interval)
+            ring_buffer.extend(feed.get_rows())
+            last = ring_buffer.get_last()
+            if last:
+                print(f'{last["time(millisecond)"] / 1000:8.1f} s, '
+                      f'{last["height_above_takeoff(feet)"]:6.1f} ft, '
+                      f'{ring_buffer.size:,} buffered, {ring_buffer.total:,} received, '
+                      f'rss: {process.memory_info().rss:,}')
+
+    except KeyboardInterrupt:
+        feed.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='live telemetry of dji mavic pro flights')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    replay_parser = subparsers.add_parser('replay', help='play back a log as a live feed')
+    replay_parser.add_argument('--file', default=replay_file)
+    replay_parser.add_argument('--url', default=default_url, help='udp://, tcp:// or - for stdout')
+    replay_parser.add_argument('--speed', type=float, default=1)
+    replay_parser.add_argument('--loop', action='store_true')
+    monitor_parser = subparsers.add_parser('monitor', help='print a live feed')
+    monitor_parser.add_argument('--url', default=default_url, help='udp://, tcp:// or - for stdin')
+    monitor_parser.add_argument('--capacity', type=int, default=default_capacity)
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        server = ReplayServer(args.file, url=args.url, speed=args.speed, loop=args.loop)
+        print(server, file=sys.stderr)
+        try:
+            server.serve()
+
+        except KeyboardInterrupt:
+            server.stop()
+
+    else:
+        monitor(args.url, capacity=args.capacity)
+
+
+if __name__ == '__main__':
+    main()
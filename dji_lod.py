@@ -0,0 +1,88 @@
+''' module for level of detail of graph traces for dji mavic pro
+'''
+import numpy as np
+
+
+def get_bins(x, n_bins):
+    ''' split samples in runs of n_bins equal x intervals, x must be sorted
+        returns:
+            run number per sample, start index per run
+    '''
+    span = x[-1] - x[0] if len(x) else 0
+    if span > 0:
+        bins = np.minimum(((x - x[0]) / span * n_bins).astype(np.int64), n_bins - 1)
+
+    else:
+        bins = np.zeros(len(x), dtype=np.int64)
+
+    new_run = np.diff(bins) != 0
+    run_starts = np.concatenate(([0], np.flatnonzero(new_run) + 1))
+    sample_runs = np.concatenate(([0], np.cumsum(new_run)))
+    return sample_runs, run_starts
+
+
+def first_in_run(mask, sample_runs):
+    ''' index of the first True value of mask in each run '''
+    candidates = np.flatnonzero(mask)
+    _, first = np.unique(sample_runs[candidates], return_index=True)
+    return candidates[first]
+
+
+def minmax_decimate(x, y, n_bins):
+    ''' M4 decimation: per x interval keep the first, last, minimum and
+        maximum sample, so a line drawn through the kept samples has the
+        same pixels as the full line when n_bins is the width in pixels
+        arguments:
+            x: sorted x values (time)
+            y: y values
+            n_bins: number of x intervals
+        returns:
+            sorted indices of the kept samples
+    '''
+    n = len(x)
+    if n <= 4 * n_bins:
+        return np.arange(n)
+
+    sample_runs, run_starts = get_bins(x, n_bins)
+    run_ends = np.concatenate((run_starts[1:], [n])) - 1
+    counts = run_ends - run_starts + 1
+    run_min = np.repeat(np.fmin.reduceat(y, run_starts), counts)
+    run_max = np.repeat(np.fmax.reduceat(y, run_starts), counts)
+    return np.unique(np.concatenate((
+        run_starts, run_ends,
+        first_in_run(y == run_min, sample_runs),
+        first_in_run(y == run_max, sample_runs),
+    )))
+
+
+class LodTrace:
+    ''' decimated trace of which a prefix can be taken in constant work, the
+        prefix consists of the decimated samples of the completed intervals
+        and the full samples of the current interval
+        methods:
+            full: decimated x, y of the whole trace
+            prefix: decimated x, y of the samples before index
+    '''
+
+    def __init__(self, x, y, n_bins):
+        self.x = x
+        self.y = y
+        self.lod_index = minmax_decimate(x, y, n_bins)
+        self.sample_runs, self.run_starts = get_bins(x, n_bins)
+
+    def full(self):
+        return self.x[self.lod_index], self.y[self.lod_index]
+
+    def prefix(self, index):
+        if index <= 0:
+            return self.x[:0], self.y[:0]
+
+        index = min(index, len(self.x))
+        run_start = self.run_starts[self.sample_runs[index - 1]]
+        lod_end = np.searchsorted(self.lod_index, run_start)
+        prefix_index = np.concatenate(
+            (self.lod_index[:lod_end], np.arange(run_start, index)))
+        return self.x[prefix_index], self.y[prefix_index]
+
+    def __repr__(self):
+        return f'trace of {len(self.x):,} samples decimated to {len(self.lod_index):,}'
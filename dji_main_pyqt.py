@@ -1,18 +1,29 @@
 ''' application to show dji mavic drone flights from UAV Drone csv files
 '''
+import os
+import gc
 import sys
+import threading
 from pathlib import Path
+import psutil
+import numpy as np
+from decouple import config
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt5 import QtCore
 from PyQt5.QtWidgets import (
     QWidget, QHBoxLayout, QVBoxLayout, QLabel, QApplication, QPushButton,
-    QFileDialog, QStackedWidget,
+    QFileDialog, QStackedWidget, QComboBox, QSlider,
 )
-from dji_mavic_io import read_flightdata_csv
+from dji_mavic_io import read_flightdata_csv, FEET_METER_CONV, MILES_KM_CONV
 from dji_remote_control import RemoteControlDisplay
 from dji_flight_graphs import GraphDisplay
-from dji_map import MapDisplay
+from dji_map import MapDisplay, basemap_source, tr_wgs_osm
+from dji_live import LiveFeed, RingBuffer, live_columns, live_window, restart_time
+from dji_playback import PlaybackClock, playback_speeds, frame_interval
+from dji_blit import BlitManager
+from dji_stats import RollingStats
+from utils.plogger import Profiler, profiled
 
 #TODO port to QGIS
 
@@ -23,8 +34,49 @@ anticlockwise_symbol = '\u21b6'
 clockwise_symbol = '\u21b7'
 right_arrow_symbol = '\u25B6'
 left_arrow_symbol = '\u25C0'
-samplerate = 3
-display_frequency = 10  # display is every 10 * 3 samples
+display_frequency = 10  # display is every 10 frames
+status_window = 5  # seconds of flight averaged in the status line
+profile_file = 'dji_profile.json'
+soak_warmup = 5  # opens before the reference memory is taken
+soak_max_growth = 20 * 1024**2  # bytes the rss may grow after the warm-up
+profile_sites = [
+    'frame', 'blit.GraphDisplay', 'blit.MapDisplay', 'blit.RemoteControlDisplay',
+]
+flightdata_columns = (
+    RemoteControlDisplay.flightdata_columns + GraphDisplay.flightdata_columns +
+    MapDisplay.flightdata_columns
+)
+# the live buffer keeps the track projected for the map next to the feed columns
+live_channels = live_columns + ['track_x', 'track_y']
+
+
+class TaskSignals(QtCore.QObject):
+    finished = QtCore.pyqtSignal(int, object)
+    failed = QtCore.pyqtSignal(int, str)
+
+
+class Task(QtCore.QRunnable):
+    ''' runs a function in the thread pool, the result is emitted with the
+        load generation so results of a previous file can be ignored
+    '''
+
+    def __init__(self, generation, func, *args, **kwargs):
+        super().__init__()
+        self.generation = generation
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskSignals()
+
+    def run(self):
+        try:
+            result = self.func(*self.args, **self.kwargs)
+
+        except Exception as e:  #pylint: disable=broad-except
+            self.signals.failed.emit(self.generation, str(e))
+            return
+
+        self.signals.finished.emit(self.generation, result)
 
 
 class DashboardShow(QWidget):
@@ -32,11 +84,28 @@ class DashboardShow(QWidget):
     def __init__(self):
         super().__init__()
         self.md, self.gd, self.rcd = None, None, None
+        self.blit_manager = None
         self.samples = None
+        self.time_ms = None
+        self.clock = None
+        self.index = None
+        self.speed = playback_speeds[0]
+        self.pause = False
+        self.dropped_frames = 0
+        self.last_frame_time = None
         self.cntr_enabled = False
-        self.avg_height, self.avg_speed, self.avg_distance = 0, 0, 0
+        self.filename = None
+        self.rolling_stats = None
         self.display_counter = 0
         self.loop_running = False
+        self.thread_pool = QtCore.QThreadPool(self)
+        self.load_generation = 0
+        self.cancel_event = threading.Event()
+        self.basemap_loading = False
+        self.basemap_bounds = None
+        self.feed = None
+        self.live_buffer = None
+        Profiler.enable(config('DJI_PROFILE', default=False, cast=bool))
 
         self.md_stack = QStackedWidget(self)
         self.md_stack.addWidget(FigureCanvas(Figure()))
@@ -44,7 +113,11 @@ class DashboardShow(QWidget):
         self.gd_stack.addWidget(FigureCanvas(Figure()))
         self.rc_stack = QStackedWidget(self)
         self.rc_stack.addWidget(FigureCanvas(Figure()))
-        self.stack_depth = 0
+        self.canvases = []
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(frame_interval)
+        self.timer.timeout.connect(self.on_frame)
 
         self.initUI()
 
@@ -66,6 +139,14 @@ class DashboardShow(QWidget):
         hbox_displays.addLayout(vbox_left)
         hbox_displays.addWidget(self.md_stack)
 
+        # setup timeline, the slider value is the flight position in ms
+        hbox_timeline = QHBoxLayout()
+        self.timeline = QSlider(QtCore.Qt.Horizontal)
+        self.timeline.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.timeline.setEnabled(False)
+        self.timeline.valueChanged.connect(self.cntr_seek)
+        hbox_timeline.addWidget(self.timeline)
+
         # setup status line
         hbox_statusline = QHBoxLayout()
         hbox_statusline.setAlignment(QtCore.Qt.AlignLeft)
@@ -97,6 +178,12 @@ class DashboardShow(QWidget):
         stop_button.setFocusPolicy(QtCore.Qt.NoFocus)
         hbox_buttons.addWidget(stop_button)
 
+        speed_combo = QComboBox()
+        speed_combo.setFocusPolicy(QtCore.Qt.NoFocus)
+        speed_combo.addItems([f'{speed}x' for speed in playback_speeds])
+        speed_combo.currentIndexChanged.connect(self.cntr_speed)
+        hbox_buttons.addWidget(speed_combo)
+
         quit_button = QPushButton('quit')
         quit_button.clicked.connect(self.cntr_quit)
         quit_button.setFocusPolicy(QtCore.Qt.NoFocus)
@@ -107,97 +194,367 @@ class DashboardShow(QWidget):
         hbox_buttons.addWidget(self.filename_label)
 
         mainbox.addLayout(hbox_displays)
+        mainbox.addLayout(hbox_timeline)
         mainbox.addLayout(hbox_statusline)
         mainbox.addLayout(hbox_buttons)
 
         self.setLayout(mainbox)
 
-    def display_status(self, time_ms, height, speed, distance):
-        if self.display_counter == display_frequency:
-            t = (
-                f'{time_ms:5.0f}: '
-                f'{self.avg_height/ self.display_counter:4.0f} ft, '
-                f'{self.avg_speed / self.display_counter:4.0f} km/h, '
-                f'{self.avg_distance / self.display_counter:4.0f} meter'
-            )
-            self.status_label.setText(t)
-            self.avg_height = 0
-            self.avg_speed = 0
-            self.avg_distance = 0
-            self.display_counter = 0
-
-        else:
-            if self.display_counter == 1:
-                self.avg_height = height
-                self.avg_speed = speed
-                self.avg_distance = distance
-
-            else:
-                self.avg_height += height
-                self.avg_speed += speed
-                self.avg_distance += distance
+    def display_status(self, index):
+        ''' status line with the mean height, speed and distance over the
+            last status_window seconds of flight, updated every
+            display_frequency frames
+        '''
+        self.display_counter += 1
+        if self.display_counter < display_frequency:
+            return
 
+        self.display_counter = 0
+        time_s = self.gd.fl_time[index]
+        start, end = self.rolling_stats.get_window(time_s, status_window)
+        mean = self.rolling_stats.mean
+        self.set_status(
+            time_s, mean('height', start, end), mean('speed', start, end),
+            self.rolling_stats.max('speed', start, end), mean('distance', start, end),
+        )
+
+    def display_live_status(self, time_s, height, speed, dist):
+        ''' status line of a live feed, the window arrays are short so the
+            statistics are taken directly
+        '''
         self.display_counter += 1
+        if self.display_counter < display_frequency:
+            return
+
+        self.display_counter = 0
+        start = np.searchsorted(time_s, time_s[-1] - status_window, side='right')
+        self.set_status(
+            time_s[-1], np.nanmean(height[start:]), np.nanmean(speed[start:]),
+            np.nanmax(speed[start:]), np.nanmean(dist[start:]),
+        )
+
+    def set_status(self, time_s, height, speed, max_speed, dist):
+        status = (
+            f'{time_s * 1000:5.0f}: '
+            f'{height:4.0f} ft, '
+            f'{speed:4.0f} km/h '
+            f'(max {max_speed:3.0f}), '
+            f'{dist:4.0f} meter'
+        )
+        if Profiler.enabled:
+            status += f' | {Profiler.summary(profile_sites)}'
+
+        self.status_label.setText(status)
 
     def cntr_open(self):
         if self.loop_running:
             return
 
         filename, _ = QFileDialog.getOpenFileName(self, 'OpenFile')
-        filename = Path(filename)
-        flightdata_df = read_flightdata_csv(filename)
+        if not filename:
+            return
+
+        self.open_file(Path(filename))
+
+    def open_file(self, filename):
+        ''' read the file in a worker thread, a load that is still running
+            for a previous file is cancelled
+        '''
+        self.stop_live()
+        self.new_generation()
+        self.status_label.setText(f' reading {filename.name} ...')
+        self.start_task(
+            self.on_data_loaded, read_flightdata_csv, filename, columns=flightdata_columns)
+        self.filename = filename
+
+    def new_generation(self):
+        ''' start a new load generation, tasks still running for the
+            previous file or feed are cancelled or their results ignored
+        '''
+        self.load_generation += 1
+        self.cancel_event.set()
+        self.cancel_event = threading.Event()
+        self.basemap_loading = False
+        self.basemap_bounds = None
+        self.cntr_enabled = False
+
+    def start_task(self, on_finished, func, *args, **kwargs):
+        task = Task(self.load_generation, func, *args, **kwargs)
+        task.signals.finished.connect(on_finished)
+        task.signals.failed.connect(self.on_task_failed)
+        self.thread_pool.start(task)
+
+    def on_data_loaded(self, generation, flightdata_df):
+        if generation != self.load_generation:
+            return
 
         if flightdata_df.empty:
+            self.status_label.setText(f' unable to read {self.filename.name}')
             return
 
-        self.filename_label.setText(f'file: {filename.name}')
+        self.filename_label.setText(f'file: {self.filename.name}')
         self.mplfigs_to_canvas(flightdata_df)
         self.cntr_enabled = True
-        self.pause = False
+
+        # the basemap streams in when its tiles arrive
+        self.status_label.setText(' loading basemap ...')
+        self.request_basemap()
+
+    def request_basemap(self):
+        ''' fetch the basemap for the map bounds in a worker thread, one
+            fetch at a time, in live mode the bounds are checked again
+            when it arrives
+        '''
+        if self.basemap_loading:
+            return
+
+        self.basemap_loading = True
+        self.basemap_bounds = self.md.map_bounds
+        self.start_task(
+            self.on_basemap_loaded, self.md.get_basemap, source=basemap_source,
+            cancel=self.cancel_event,
+        )
+
+    def on_basemap_loaded(self, generation, basemap):
+        if generation != self.load_generation:
+            return
+
+        self.basemap_loading = False
+        self.md.set_basemap(*basemap)
+        self.md.fig.canvas.draw_idle()
+        if not self.loop_running:
+            self.status_label.setText(' ready')
+
+    def on_task_failed(self, generation, message):
+        if generation != self.load_generation:
+            return
+
+        self.basemap_loading = False
+        self.status_label.setText(f' error: {message}')
 
     def cntr_run(self):
-        if not self.cntr_enabled:
+        ''' run from the timeline position, or from the start if the
+            timeline is at the end of the flight
+        '''
+        if not self.cntr_enabled or self.loop_running:
             return
 
-        # display initial statys
+        position = self.clock.get_position()
+        if position >= self.time_ms[-1]:
+            position = self.time_ms[0]
+
+        # display initial status
+        self.index = self.clock.get_index_at(position)
         self.display_counter = display_frequency
-        vals = self.gd.update(0)
-        self.display_status(*vals)
+        self.show_frame(self.index)
 
+        self.pause = False
+        self.dropped_frames = 0
+        self.last_frame_time = None
+        self.clock.start(position)
         self.loop_running = True
-        for index in range(0, self.samples, samplerate):
-            if not self.loop_running:
-                break
+        self.timer.start()
+
+    def on_frame(self):
+        ''' called by the timer, shows the sample at the current flight
+            position, frames are dropped when rendering falls behind
+        '''
+        if self.feed:
+            self.on_live_frame()
+            return
 
-            self.rcd.update(index)
-            self.rcd.blit()
+        now = self.clock.clock()
+        if self.last_frame_time is not None:
+            late_frames = int((now - self.last_frame_time) * 1000 / frame_interval) - 1
+            self.dropped_frames += max(late_frames, 0)
+            if late_frames > 0:
+                Profiler.count('dropped_frames', late_frames)
+
+        self.last_frame_time = now
+
+        index = self.clock.get_index()
+        if index != self.index:
+            self.index = index
+            self.show_frame(index)
+
+        self.set_timeline(self.clock.get_position())
+        if self.clock.finished():
+            self.cntr_stop()
+
+    @profiled('frame')
+    def show_frame(self, index):
+        self.rcd.update(index)
+        self.gd.update(index)
+        self.display_status(index)
+        self.md.update_location(index)
+        self.blit_manager.blit()
+
+    def open_live(self, url):
+        ''' show a live feed from url (udp://host:port, tcp://host:port or -
+            for stdin), the displays are made when the first row with a gps
+            position arrives
+        '''
+        self.stop_live()
+        self.cntr_stop()
+        self.remove_figs()
+        self.new_generation()
+        self.timeline.setEnabled(False)
+        self.feed = LiveFeed(url)
+        self.live_buffer = RingBuffer(live_channels, capacity=self.feed.queue.maxlen)
+        self.feed.start()
+        self.filename_label.setText(f'live: {url}')
+        self.status_label.setText(f' waiting for {url} ...')
+        self.display_counter = display_frequency
+        self.pause = False
+        self.loop_running = True
+        self.timer.start()
 
-            vals = self.gd.update(index)
-            self.display_status(*vals)
+    def stop_live(self):
+        if not self.feed:
+            return
 
-            self.gd.blit()
+        self.timer.stop()
+        self.feed.stop()
+        self.feed = None
+        self.loop_running = False
+        self.pause = False
 
-            self.md.update_location(index)
-            self.md.blit()
+    def on_live_frame(self):
+        ''' move the rows that arrived into the ring buffer, with the track
+            projected once per row, and show the sliding window unless
+            paused
+        '''
+        rows = self.feed.get_rows()
+        n_rows = len(rows['time(millisecond)'])
+        if n_rows == 0:
+            if not self.feed.running():
+                self.status_label.setText(
+                    f' error: {self.feed.error}' if self.feed.error else ' live feed ended')
+                self.stop_live()
 
-            while self.pause:
-                self.md.blit()
-                if not self.loop_running:
-                    break
+            return
 
-        self.loop_running = False
+        # time going back more than restart_time is the start of a new
+        # flight, the window starts again from its first row and the
+        # displays are made again, so the limits, home point and basemap
+        # are of the new flight; smaller steps back are jitter of the log
+        last_time = self.live_buffer.get_last().get('time(millisecond)', -np.inf)
+        restarts = np.flatnonzero(
+            np.diff(rows['time(millisecond)'], prepend=last_time) < -1000 * restart_time)
+        if len(restarts):
+            rows = {key: values[restarts[-1]:] for key, values in rows.items()}
+            self.live_buffer.clear()
+            self.remove_figs()
+            self.new_generation()
+
+        # a position of 0, 0 is a log without gps fix yet
+        lats, lons = rows['latitude'], rows['longitude']
+        no_fix = (lats == 0) & (lons == 0)
+        rows['track_x'], rows['track_y'] = tr_wgs_osm.transform(
+            np.where(no_fix, np.nan, lats), np.where(no_fix, np.nan, lons))
+        self.live_buffer.extend(rows)
+
+        if self.pause or (self.md is None and not self.live_displays()):
+            return
 
-    def cntr_pause(self):
+        self.show_live_frame(self.live_buffer.get_time_window(live_window))
+        if self.md.map_bounds != self.basemap_bounds:
+            self.request_basemap()
+
+    def live_displays(self) -> bool:
+        ''' make the displays in live mode from the rows with a gps position
+            received so far
+            returns:
+                True if there are rows with a gps position
+        '''
+        seed_df = self.live_buffer.to_frame()
+        seed_df = seed_df[np.isfinite(seed_df['track_x'])].fillna(0)
+        if seed_df.empty:
+            return False
+
+        self.rcd = RemoteControlDisplay(seed_df)
+        self.gd = GraphDisplay(seed_df)
+        self.md = MapDisplay(seed_df, basemap=False)
+        self.gd.set_live()
+        self.md.set_live()
+
+        self.displays_to_canvas()
+        return True
+
+    @profiled('frame')
+    def show_live_frame(self, window):
+        time_s = window['time(millisecond)'] / 1000
+        height = window['height_above_takeoff(feet)']
+        speed = window['speed(mph)'] * MILES_KM_CONV
+        dist = window['distance(feet)'] * FEET_METER_CONV
+        self.rcd.update_values(*(
+            window[key][-1] for key in
+            ['rc_elevator', 'rc_aileron', 'rc_throttle', 'rc_rudder']))
+        self.gd.update_window(time_s, height, speed, dist)
+        self.display_live_status(time_s, height, speed, dist)
+        self.md.update_window(window['track_x'], window['track_y'])
+        self.blit_manager.blit()
+
+    def set_timeline(self, position):
+        ''' move the timeline slider without triggering a seek '''
+        self.timeline.blockSignals(True)
+        self.timeline.setValue(int(min(position, self.time_ms[-1])))
+        self.timeline.blockSignals(False)
+
+    def cntr_seek(self, position):
+        ''' seek to a flight position in ms from the timeline, running or
+            paused playback continues from there, the displays are set from
+            the arrays of the displays so the work does not depend on the
+            distance of the jump
+        '''
         if not self.cntr_enabled:
             return
 
+        self.clock.seek(position)
+        index = self.clock.get_index_at(position)
+        if index != self.index:
+            self.index = index
+            self.display_counter = display_frequency
+            self.show_frame(index)
+
+    def cntr_pause(self):
+        if not self.loop_running:
+            return
+
+        # a paused live feed keeps the timer running to fill the ring
+        # buffer without drawing, on resume the displays jump to the
+        # latest window
         self.pause = not self.pause
+        if self.feed:
+            return
+
+        if self.pause:
+            self.timer.stop()
+            self.clock.pause()
+
+        else:
+            self.last_frame_time = None
+            self.clock.resume()
+            self.timer.start()
+
+    def cntr_speed(self, speed_index):
+        self.speed = playback_speeds[speed_index]
+        if self.clock:
+            self.clock.set_speed(self.speed)
 
     def cntr_stop(self):
+        if self.feed:
+            self.stop_live()
+            self.status_label.setText(' live feed stopped')
+            return
+
         if not self.cntr_enabled:
             return
 
+        self.timer.stop()
+        self.clock.pause()
         self.loop_running = False
+        self.pause = False
 
     def cntr_quit(self):
         self.close()
@@ -206,45 +563,116 @@ class DashboardShow(QWidget):
     def keyPressEvent(self, event):
         # if spacebar pressed pause
         if event.key() == 32:
-            self.pause = not self.pause
+            self.cntr_pause()
 
-    def mplfigs_to_canvas(self, flightdata_df):
-        if self.md:
-            self.rcd.remove_fig()
-            self.gd.remove_fig()
-            self.md.remove_fig()
+        # p switches profiling on and off, when switched off the stats are
+        # written to profile_file
+        elif event.key() == QtCore.Qt.Key_P:
+            self.toggle_profiler()
 
-        self.samples = len(flightdata_df)
-        self.rcd = RemoteControlDisplay(flightdata_df)
-        self.gd = GraphDisplay(flightdata_df)
-        self.md = MapDisplay(flightdata_df)
+    def toggle_profiler(self):
+        if Profiler.enabled:
+            Profiler.enable(False)
+            Profiler.dump(profile_file)
+            self.status_label.setText(f' profile written to {profile_file}')
 
-        md_canvas = FigureCanvas(self.md.fig)
-        gd_canvas = FigureCanvas(self.gd.fig)
-        rc_canvas = FigureCanvas(self.rcd.fig)
-
-        md_canvas.mpl_connect('resize_event', self.md.on_resize)
-        gd_canvas.mpl_connect('resize_event', self.gd.on_resize)
-        rc_canvas.mpl_connect('resize_event', self.rcd.on_resize)
+        else:
+            Profiler.reset()
+            Profiler.enable(True)
+            self.status_label.setText(' profiling ...')
+
+    def remove_figs(self):
+        ''' remove the canvases of the current file from the stacks, delete
+            them and close their figures, so memory does not grow when
+            opening many files
+        '''
+        for stack, canvas in self.canvases:
+            stack.removeWidget(canvas)
+            canvas.deleteLater()
+
+        self.canvases = []
+        for display in [self.rcd, self.gd, self.md]:
+            if display:
+                display.remove_fig()
 
-        self.md_stack.addWidget(md_canvas)
-        self.gd_stack.addWidget(gd_canvas)
-        self.rc_stack.addWidget(rc_canvas)
-        self.stack_depth += 1
-        print(f'stack depth: {self.stack_depth}')
+        self.md, self.gd, self.rcd = None, None, None
+        self.blit_manager = None
 
-        self.md_stack.setCurrentIndex(self.stack_depth)
-        self.gd_stack.setCurrentIndex(self.stack_depth)
-        self.rc_stack.setCurrentIndex(self.stack_depth)
+    def mplfigs_to_canvas(self, flightdata_df):
+        self.remove_figs()
 
-        self.md.on_resize(None)
-        self.gd.on_resize(None)
-        self.rcd.on_resize(None)
+        self.samples = len(flightdata_df)
+        self.time_ms = flightdata_df['time(millisecond)'].to_numpy(dtype=np.float64)
+        self.rcd = RemoteControlDisplay(flightdata_df)
+        self.gd = GraphDisplay(flightdata_df, incremental=True)
+        self.md = MapDisplay(flightdata_df, basemap=False)
+        self.clock = PlaybackClock(self.time_ms, speed=self.speed)
+        self.index = None
+        self.timeline.blockSignals(True)
+        self.timeline.setRange(int(self.time_ms[0]), int(self.time_ms[-1]))
+        self.timeline.setValue(int(self.time_ms[0]))
+        self.timeline.blockSignals(False)
+        self.timeline.setEnabled(True)
+        self.rolling_stats = RollingStats(self.gd.fl_time, {
+            'height': self.gd.fl_height, 'speed': self.gd.fl_speed,
+            'distance': self.gd.fl_dist,
+        })
+        self.displays_to_canvas()
+
+    def displays_to_canvas(self):
+        for stack, display in [
+                (self.md_stack, self.md), (self.gd_stack, self.gd),
+                (self.rc_stack, self.rcd)]:
+            canvas = FigureCanvas(display.fig)
+            canvas.mpl_connect('resize_event', display.on_resize)
+            stack.addWidget(canvas)
+            stack.setCurrentWidget(canvas)
+            self.canvases.append((stack, canvas))
+            display.on_resize(None)
+
+        self.blit_manager = BlitManager([self.rcd, self.gd, self.md])
+
+
+def soak(filename, opens) -> bool:
+    ''' open a file repeatedly and print the memory use, the resident set
+        size after the last open may not be more than soak_max_growth
+        above the one after soak_warmup opens
+        returns:
+            True if the memory growth is within soak_max_growth
+    '''
+    app = QApplication([])
+    dashboard = DashboardShow()
+    flightdata_df = read_flightdata_csv(filename, columns=flightdata_columns)
+    process = psutil.Process(os.getpid())
+    opens = max(opens, soak_warmup + 1)
+    warmup_rss = None
+    for i in range(1, opens + 1):
+        dashboard.mplfigs_to_canvas(flightdata_df)
+        dashboard.md.add_basemap_osm(source=basemap_source)
+        app.processEvents()
+        QtCore.QCoreApplication.sendPostedEvents(None, QtCore.QEvent.DeferredDelete)
+        if i == soak_warmup or i == opens or i % 10 == 0:
+            gc.collect()
+            rss = process.memory_info().rss
+            print(f'opens: {i}, rss: {rss:,}')
+            if i == soak_warmup:
+                warmup_rss = rss
+
+    growth = rss - warmup_rss
+    print(f'rss growth after {soak_warmup} opens: {growth:,} bytes, '
+          f'limit {soak_max_growth:,} bytes')
+    return growth <= soak_max_growth
 
 
 def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--soak':
+        sys.exit(0 if soak(sys.argv[3], int(sys.argv[2])) else 1)
+
     app = QApplication([])
-    _ = DashboardShow()
+    dashboard = DashboardShow()
+    if len(sys.argv) == 3 and sys.argv[1] == '--live':
+        dashboard.open_live(sys.argv[2])
+
     sys.exit(app.exec_())
 
 
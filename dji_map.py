@@ -1,16 +1,17 @@
 ''' module for flightpath map for dji mavic pro
 '''
-import json
-from decouple import config
 import numpy as np
 from matplotlib import ticker
 import matplotlib.pyplot as plt
 from matplotlib import patches as mpl_patches
 import pyproj
-from shapely.geometry import Point, LineString
-from geopandas import GeoDataFrame
-import contextily as ctx
-from dji_mavic_io import read_flightdata_csv
+from dji_mavic_io import read_flightdata_csv, FEET_METER_CONV
+from dji_tiles import get_mosaic_cache, get_source
+from dji_blit import BlitManager
+from dji_resample import resample_flightdata
+from dji_simplify import simplify_track, get_compression_ratio
+from dji_live import expand_limits
+from utils.plogger import profiled
 
 #pylint: disable=no-value-for-parameter
 
@@ -25,7 +26,11 @@ drone_color = 'blue'
 drone_size = 15
 arial_limit = 150  # meter
 tick_intval = 500  # meter
+attribution_size = 6
+basemap_source = 'maptiler_hybrid.json'
+track_tolerance = 1.0  # meter in EPSG:3857
 tr_wgs_osm = pyproj.Transformer.from_crs(EPSG_WGS84, EPSG_OSM)
+tr_osm_wgs = pyproj.Transformer.from_crs(EPSG_OSM, EPSG_WGS84, always_xy=True)
 
 
 @ticker.FuncFormatter
@@ -34,68 +39,97 @@ def major_formatter(x, pos):
     return f'{x % 10_000:.0f}'
 
 
-def read_json_maptiler(json_file):
-    try:
-        with open(json_file) as f:
-            maptiler_source = json.load(f)
-            maptiler_source['url'] = ''.join([
-                maptiler_source['url'], '?key=', config('MAPTILER_API_KEY')
-            ])
-            return maptiler_source
-
-    except (KeyError, FileNotFoundError):
-        return None
-
-
 class MapDisplay:
     ''' display of drone with osm map in background
+        the flightpath is simplified within tolerance meters, the drone
+        position uses the full track
         methods:
-            add_basemap_osm: set background map from ctx.providers.OpenStreetMap.Mapnik
+            add_basemap_osm: set background map from the mosaic and tile cache,
+                             default source is OpenStreetMap
+            get_basemap: basemap image for the map bounds, can run in a thread
+            set_basemap: show a basemap image
             draw: initial draw
             update_location: update drone location
+            blit_regions: regions and animated artists for the blit manager
             blit: blit the drone on the map
             on_key: pause on key
             on_resize: redraws on resize
+            set_live: switch to the track of a sliding window of a live feed
+            update_window: show the track of the window and the drone
     '''
+    flightdata_columns = ['latitude', 'longitude', 'height_above_takeoff(feet)']
 
-    def __init__(self, flightdata_df):
+    def __init__(self, flightdata_df, basemap=True, tolerance=track_tolerance):
 
-        # create flightpoints and flightpath in osm projection
-        lons = np.array(flightdata_df['longitude'].to_list(), dtype=np.float64)
-        lats = np.array(flightdata_df['latitude'].to_list(), dtype=np.float64)
-        self.flightpoints = [
-            Point(xy) for xy in tr_wgs_osm.itransform([xy for xy in zip(lats, lons)])
-        ]
-        self.flightpath = [
-            LineString([point1, point2]) for point1, point2
-            in zip(self.flightpoints, self.flightpoints[1:])
-        ]
-        flightpath_gpd = GeoDataFrame(geometry=self.flightpath)
-        flightpath_gpd.crs = EPSG_OSM
+        # create flightpath in osm projection as x, y arrays
+        lons = flightdata_df['longitude'].to_numpy(dtype=np.float64)
+        lats = flightdata_df['latitude'].to_numpy(dtype=np.float64)
+        track_x, track_y = tr_wgs_osm.transform(lats, lons)
+        self.track_x = np.asarray(track_x, dtype=np.float64)
+        self.track_y = np.asarray(track_y, dtype=np.float64)
+
+        # the flightpath line is simplified, the drone uses the full track;
+        # heights are scaled to EPSG:3857 units at the latitude of the
+        # homepoint so altitude extremes count with the same tolerance
+        track_z = None
+        if 'height_above_takeoff(feet)' in flightdata_df:
+            track_z = np.nan_to_num(flightdata_df['height_above_takeoff(feet)'].to_numpy(
+                dtype=np.float64)) * FEET_METER_CONV / np.cos(np.radians(lats[0]))
 
-        # set the homepoint and convert to map projection
-        homepoint_gpd = GeoDataFrame(geometry=[self.flightpoints[0]])
-        homepoint_gpd.crs = EPSG_OSM
+        self.path_index = simplify_track(
+            self.track_x, self.track_y, z=track_z, tolerance=tolerance)
+        self.compression_ratio = get_compression_ratio(len(self.track_x), self.path_index)
 
         # create the figure and axes
         self.fig, self.ax_map = plt.subplots(figsize=fig_size)
         self.fig.canvas.set_window_title('Drone flightpath')
         self.fig.suptitle(None)
+        self.ax_map.set_aspect('equal')
 
         self.ax_map.xaxis.set_major_formatter(major_formatter)
         self.ax_map.yaxis.set_major_formatter(major_formatter)
         self.ax_map.xaxis.set_major_locator(ticker.MultipleLocator(tick_intval))
         self.ax_map.yaxis.set_major_locator(ticker.MultipleLocator(tick_intval))
 
-        # plot the flightpath, homepoint
-        flightpath_gpd.plot(ax=self.ax_map, color=flightpath_color)
-        homepoint_gpd.plot(
-            ax=self.ax_map, marker='*', color=homepoint_color, markersize=homepoint_size
+        # plot the flightpath as a single line and the homepoint
+        self.flightpath, = self.ax_map.plot(
+            self.track_x[self.path_index], self.track_y[self.path_index],
+            color=flightpath_color)
+        self.live = False
+        self.basemap_artists = []
+        self.ax_map.scatter(
+            self.track_x[0], self.track_y[0], marker='*', color=homepoint_color,
+            s=homepoint_size,
         )
 
-        # adjust map limits to make x and y dimensions the same
-        xlimits = list(self.ax_map.get_xlim())
-        ylimits = list(self.ax_map.get_ylim())
+        self.set_limits(self.ax_map.get_xlim(), self.ax_map.get_ylim())
+
+        # add the basemap, with basemap=False it can be added later by
+        # set_basemap with the result of get_basemap
+        # ctx.providers.Esri.WorldStreetMap
+        if basemap:
+            self.add_basemap_osm(source=basemap_source)
+
+        self.background = None
+
+        # add the drone
+        self.drone = mpl_patches.Circle(
+            (self.track_x[0], self.track_y[0]),
+            fc=drone_color, radius=drone_size, animated=True
+        )
+        self.ax_map.add_patch(self.drone)
+
+        # make connections for key and figure resize
+        connect = self.fig.canvas.mpl_connect
+        connect('resize_event', self.on_resize)
+        self.blit_manager = BlitManager([self])
+
+    def set_limits(self, xlimits, ylimits):
+        ''' set the map limits to xlimits, ylimits with a margin of
+            arial_limit, x and y dimensions are made the same
+        '''
+        xlimits = list(xlimits)
+        ylimits = list(ylimits)
         if xlimits[1] - xlimits[0] > ylimits[1] - ylimits[0]:
             xlimits[0] -= arial_limit
             xlimits[1] += arial_limit
@@ -112,56 +146,106 @@ class MapDisplay:
             xc = 0.5 * (xlimits[1] + xlimits[0])
             self.ax_map.set_xlim(xc - dist, xc + dist)
 
-        # add the basemap
-        # ctx.providers.Esri.WorldStreetMap
-        self.add_basemap_osm(source='maptiler_hybrid.json')
-        self.background = None
-
-        # add the drone
-        self.drone = mpl_patches.Circle(
-            (self.flightpoints[0].x, self.flightpoints[0].y),
-            fc=drone_color, radius=drone_size, animated=True
+        # lon/ lat bounds of the map for the basemap
+        xlimits = self.ax_map.get_xlim()
+        ylimits = self.ax_map.get_ylim()
+        self.map_bounds = (
+            *tr_osm_wgs.transform(xlimits[0], ylimits[0]),
+            *tr_osm_wgs.transform(xlimits[1], ylimits[1]),
         )
-        self.ax_map.add_patch(self.drone)
-
-        # make connections for key and figure resize
-        connect = self.fig.canvas.mpl_connect
-        connect('resize_event', self.on_resize)
 
     def add_basemap_osm(self, source=None):
-        if source is None:
-            maptiler_source = ctx.providers.OpenStreetMap.Mapnik
-
-        elif isinstance(source, str):
-            maptiler_source = read_json_maptiler(source)
-            if not maptiler_source:
-                maptiler_source = ctx.providers.OpenStreetMap.Mapnik
-
-        else:
-            maptiler_source = source
-
-        ctx.add_basemap(self.ax_map, source=maptiler_source)
+        self.set_basemap(*self.get_basemap(source=source))
+
+    def get_basemap(self, source=None, cancel=None):
+        ''' basemap image for the map bounds, does not touch the figure so
+            it can run in a worker thread
+            arguments:
+                source: tile source, see dji_tiles.get_source
+                cancel: optional threading.Event to stop fetching tiles
+            returns:
+                image, extent, resolved source
+        '''
+        source = get_source(source)
+        img, extent = get_mosaic_cache().bounds2img(
+            *self.map_bounds, source=source, cancel=cancel)
+        return img, extent, source
+
+    def set_basemap(self, img, extent, source):
+        xlimits = self.ax_map.get_xlim()
+        ylimits = self.ax_map.get_ylim()
+        # a new basemap replaces the previous one, in live mode the basemap
+        # is fetched again when the map limits grow
+        for artist in self.basemap_artists:
+            artist.remove()
+
+        self.basemap_artists = [
+            self.ax_map.imshow(img, extent=extent, interpolation='bilinear', zorder=0),
+            self.ax_map.text(
+                0.005, 0.005, source.get('attribution', ''), size=attribution_size,
+                transform=self.ax_map.transAxes,
+            ),
+        ]
+        self.ax_map.set_xlim(xlimits)
+        self.ax_map.set_ylim(ylimits)
+        self.background = None
 
     def draw(self):
         self.fig.canvas.draw()
         self.fig.canvas.flush_events()
 
+    @profiled('update.MapDisplay')
     def update_location(self, index):
-        point = self.flightpoints[index]
-        self.drone.center = (point.x, point.y)
+        self.drone.center = (self.track_x[index], self.track_y[index])
+
+    def set_live(self):
+        ''' live mode: the flightpath is the track of the sliding window and
+            is drawn with the drone, the map limits grow when the drone
+            comes within arial_limit of the edge
+        '''
+        self.live = True
+        self.flightpath.set_animated(True)
+        self.flightpath.set_data([], [])
+        self.background = None
 
-    def blit(self):
-        if self.background is None:
-            self.background = (
-                self.fig.canvas.copy_from_bbox(self.fig.bbox)
-            )
-            self.draw()
+    @profiled('update.MapDisplay')
+    def update_window(self, track_x, track_y) -> bool:
+        ''' show the track of the window, in EPSG:3857, and the drone at its
+            last point
+            returns:
+                True if the map limits changed, the basemap is then out of
+                date and map_bounds has the new bounds
+        '''
+        valid = np.isfinite(track_x) & np.isfinite(track_y)
+        if not np.any(valid):
+            return False
+
+        track_x, track_y = track_x[valid], track_y[valid]
+        self.flightpath.set_data(track_x, track_y)
+        self.drone.center = (track_x[-1], track_y[-1])
+
+        # the limits only grow, with arial_limit around the track
+        xlimits = self.ax_map.get_xlim()
+        ylimits = self.ax_map.get_ylim()
+        inner_x = (xlimits[0] + arial_limit, xlimits[1] - arial_limit)
+        inner_y = (ylimits[0] + arial_limit, ylimits[1] - arial_limit)
+        new_x = expand_limits(inner_x, track_x[-1], track_x[-1])
+        new_y = expand_limits(inner_y, track_y[-1], track_y[-1])
+        if new_x is None and new_y is None:
+            return False
+
+        self.set_limits(new_x or inner_x, new_y or inner_y)
+        self.background = None
+        return True
 
-        else:
-            self.fig.canvas.restore_region(self.background)
-            self.fig.draw_artist(self.drone)
-            self.fig.canvas.blit(self.fig.bbox)
-            self.fig.canvas.flush_events()
+    def blit_regions(self):
+        if self.live:
+            return [(self.fig.bbox, [self.flightpath, self.drone])]
+
+        return [(self.fig.bbox, [self.drone])]
+
+    def blit(self):
+        self.blit_manager.blit()
 
     def on_resize(self, event):
         self.background = None
@@ -172,23 +256,23 @@ class MapDisplay:
 
     def __repr__(self):
         return (f'drone homepoint at: '
-                f'{int(self.flightpoints[0].x):,}, {int(self.flightpoints[0].y):,}')
+                f'{int(self.track_x[0]):,}, {int(self.track_y[0]):,}, '
+                f'flightpath of {len(self.path_index):,} of {len(self.track_x):,} points '
+                f'({self.compression_ratio:.1f}x)')
 
 
 if __name__ == '__main__':
-    samplerate = 2
+    rate = 5  # Hz
     rc_filename = 'dji_mavic_test_data_2.csv'
 
-    flightdata_df = read_flightdata_csv(rc_filename)
+    flightdata_df = resample_flightdata(read_flightdata_csv(
+        rc_filename, columns=['time(millisecond)'] + MapDisplay.flightdata_columns), rate=rate)
     md = MapDisplay(flightdata_df)
     print(md)
     plt.show(block=False)
     plt.pause(0.1)
     input('continue ...')
 
-    for index in range(0, len(flightdata_df), samplerate):
-        while md.pause:
-            md.blit()
-
+    for index in range(len(flightdata_df)):
         md.update_location(index)
         md.blit()
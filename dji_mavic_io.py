@@ -1,9 +1,17 @@
 ''' module input/ output for dji mavic pro
 '''
 import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
 import psutil
+import numpy as np
 import pandas as pd
 
+FEET_METER_CONV = 0.3048
+MILES_KM_CONV = 1.60934
+
 flightdata_keys = [
     'time(millisecond)',
     'datetime(utc)',
@@ -53,31 +61,397 @@ flightdata_keys = [
     'message',
 ]
 
+# declared schema for the Airdata csv, columns not in here are inferred
+flightdata_dtypes = {
+    'time(millisecond)': 'int64',
+    'datetime(utc)': 'category',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'height_above_takeoff(feet)': 'float32',
+    'height_above_ground_at_drone_location(feet)': 'float32',
+    'ground_elevation_at_drone_location(feet)': 'float32',
+    'altitude_above_seaLevel(feet)': 'float32',
+    'height_sonar(feet)': 'float32',
+    'speed(mph)': 'float32',
+    'distance(feet)': 'float32',
+    'satellites': 'int8',
+    'gpslevel': 'int8',
+    'voltage(v)': 'float32',
+    'max_altitude(feet)': 'float32',
+    'max_ascent(feet)': 'float32',
+    'max_speed(mph)': 'float32',
+    'max_distance(feet)': 'float32',
+    ' xSpeed(mph)': 'float32',
+    ' ySpeed(mph)': 'float32',
+    ' zSpeed(mph)': 'float32',
+    ' compass_heading(degrees)': 'float32',
+    ' pitch(degrees)': 'float32',
+    ' roll(degrees)': 'float32',
+    'isPhoto': 'int8',
+    'isVideo': 'int8',
+    'rc_elevator': 'int16',
+    'rc_aileron': 'int16',
+    'rc_throttle': 'int16',
+    'rc_rudder': 'int16',
+    'gimbal_heading(degrees)': 'float32',
+    'gimbal_pitch(degrees)': 'float32',
+    'battery_percent': 'int8',
+    'voltageCell1': 'float32',
+    'voltageCell2': 'float32',
+    'voltageCell3': 'float32',
+    'voltageCell4': 'float32',
+    'voltageCell5': 'float32',
+    'voltageCell6': 'float32',
+    'current(A)': 'float32',
+    'battery_temperature(f)': 'float32',
+    'altitude(feet)': 'float32',
+    'ascent(feet)': 'float32',
+    'flycStateRaw': 'int16',
+    'flycState': 'category',
+    'message': 'category',
+}
+# placeholder text Airdata writes in columns that require a subscription
+flightdata_na_values = ['Available with any HD 360 subscription']
+# range and center of the rc stick columns
+rc_max = 1684
+rc_min = 364
+rc_zero = 1024
+
 filename = 'dji_mavic_test_data_2.csv'
+default_chunksize = 10_000
+cache_folder = Path.home() / '.cache' / 'dji_mavic' / 'flights'
+cache_version = 3
+cache_max_entries = 100  # least recently used caches above this are removed
+
+
+def get_cache_path(file_name) -> Path:
+    ''' cache folder for a csv file, keyed by its resolved path, size and
+        modification time, so a changed file gets a fresh cache; the name
+        starts with a hash of the path, so caches of earlier versions of
+        the file can be found and removed
+        argument:
+            file_name: csv filename
+        returns:
+            path of the cache folder (may not exist yet)
+    '''
+    file_path = Path(file_name).resolve()
+    stat = file_path.stat()
+    key = f'{file_path}|{stat.st_size}|{stat.st_mtime_ns}|{cache_version}'
+    path_hash = hashlib.sha1(str(file_path).encode()).hexdigest()[:16]
+    return cache_folder / f'{path_hash}_{hashlib.sha1(key.encode()).hexdigest()}'
+
+
+def evict_flightdata_cache(cache_path: Path, max_entries: int = cache_max_entries):
+    ''' remove the caches of earlier versions of the file of cache_path and
+        the least recently used caches above max_entries, a read of a cache
+        updates its modification time
+    '''
+    path_hash = cache_path.name.split('_')[0]
+    cache_paths = []
+    for other_path in cache_path.parent.iterdir():
+        if not other_path.is_dir() or '.tmp' in other_path.name or other_path == cache_path:
+            continue
+
+        if other_path.name.split('_')[0] == path_hash:
+            shutil.rmtree(other_path, ignore_errors=True)
+
+        else:
+            cache_paths.append(other_path)
+
+    cache_paths.sort(key=lambda other_path: other_path.stat().st_mtime)
+    for other_path in cache_paths[:max(len(cache_paths) + 1 - max_entries, 0)]:
+        shutil.rmtree(other_path, ignore_errors=True)
+
+
+def write_flightdata_cache(flightdata_df: pd.DataFrame, cache_path: Path):
+    ''' store a flightdata dataframe as one .npy file per column, text
+        columns are stored as integer codes with the categories in meta.json
+        arguments:
+            flightdata_df: flightdata dataframe
+            cache_path: cache folder
+    '''
+    tmp_path = cache_path.with_name(cache_path.name + f'.tmp{os.getpid()}')
+    tmp_path.mkdir(parents=True, exist_ok=True)
+    meta = {'rows': len(flightdata_df), 'columns': []}
+    for i, key in enumerate(flightdata_df.columns):
+        column = flightdata_df[key]
+        col_meta = {'name': key, 'file': f'col_{i:02d}.npy'}
+        if column.dtype.kind in 'biuf':
+            values = column.to_numpy()
+            col_meta['kind'] = 'array'
+
+        else:
+            categorical = pd.Categorical(column)
+            values = np.asarray(categorical.codes)
+            col_meta['kind'] = 'category'
+            col_meta['categories'] = [str(c) for c in categorical.categories]
+            col_meta['ordered'] = bool(categorical.ordered)
+            col_meta['as_category'] = isinstance(column.dtype, pd.CategoricalDtype)
+
+        np.save(tmp_path / col_meta['file'], values)
+        meta['columns'].append(col_meta)
+
+    with open(tmp_path / 'meta.json', 'w') as f:
+        json.dump(meta, f)
+
+    try:
+        tmp_path.rename(cache_path)
+
+    except OSError:
+        # another process wrote the same cache first
+        shutil.rmtree(tmp_path, ignore_errors=True)
 
-def read_flightdata_csv(file_name: str) -> pd.DataFrame:
+
+def read_flightdata_cache(cache_path: Path, columns: list = None) -> pd.DataFrame:
+    ''' read a flightdata dataframe from the cache, column arrays are memory
+        mapped so no text parsing is needed
+        arguments:
+            cache_path: cache folder
+            columns: list of columns to read, None for all columns
+        returns:
+            pandas df or None if there is no valid cache
+    '''
+    try:
+        with open(cache_path / 'meta.json') as f:
+            meta = json.load(f)
+
+        flightdata = {}
+        for col_meta in meta['columns']:
+            if columns is not None and col_meta['name'] not in columns:
+                continue
+
+            values = np.load(cache_path / col_meta['file'], mmap_mode='r')
+            if col_meta['kind'] == 'category':
+                values = pd.Categorical.from_codes(
+                    values, categories=col_meta['categories'],
+                    ordered=col_meta['ordered'],
+                )
+                if not col_meta['as_category']:
+                    values = np.asarray(values, dtype=object)
+
+            flightdata[col_meta['name']] = values
+
+    except (OSError, ValueError, KeyError) as e:
+        print(f'unable to read cache {cache_path}, error message: {e}')
+        return None
+
+    return pd.DataFrame(flightdata)
+
+
+def select_columns(columns: list) -> list:
+    ''' return the requested columns in flightdata_keys order, None for all
+    '''
+    if columns is None:
+        return None
+
+    columns = set(columns)
+    return [key for key in flightdata_keys if key in columns]
+
+
+def get_flightdata_dtypes(columns: list = None, int_as_float: bool = False) -> dict:
+    ''' dtypes of flightdata_dtypes for the requested columns
+        arguments:
+            columns: list of columns, None for all columns
+            int_as_float: parse integer columns as float32, so missing values
+                          are allowed
+        returns:
+            dict of dtypes
+    '''
+    return {
+        key: 'float32' if int_as_float and dtype.startswith('int') else dtype
+        for key, dtype in flightdata_dtypes.items()
+        if columns is None or key in columns
+    }
+
+
+def parse_flightdata_csv(file_name: str, columns: list = None) -> pd.DataFrame:
+    ''' parse the csv with the declared dtypes of flightdata_dtypes, if an
+        integer column has missing values (for example a truncated last row)
+        the integer columns are parsed as float32 instead
+        arguments:
+            file_name: csv filename
+            columns: list of columns to parse, None for all columns
+        returns:
+            pandas df
+    '''
+    read_kwargs = dict(
+        skiprows=1, header=None, names=flightdata_keys, index_col=False,
+        usecols=columns, na_values=flightdata_na_values,
+    )
+
+    # text columns are read as objects and made categorical after reading,
+    # pandas parses large files in blocks and cannot combine the categories
+    # of a block where a column is empty with those of other blocks
+    def read_csv(dtypes):
+        text_keys = [key for key, dtype in dtypes.items() if dtype == 'category']
+        flightdata_df = pd.read_csv(
+            file_name, dtype={**dtypes, **{key: object for key in text_keys}},
+            **read_kwargs)
+        for key in text_keys:
+            flightdata_df[key] = flightdata_df[key].astype('category')
+
+        return flightdata_df
+
+    try:
+        return read_csv(get_flightdata_dtypes(columns))
+
+    except ValueError:
+        return read_csv(get_flightdata_dtypes(columns, int_as_float=True))
+
+
+def split_chunk(chunk: dict, chunksize: int):
+    ''' split a chunk of column arrays in chunks of at most chunksize rows
+    '''
+    rows = len(next(iter(chunk.values()), []))
+    for start in range(0, rows, chunksize):
+        yield {key: values[start:start + chunksize] for key, values in chunk.items()}
+
+
+def iter_flightdata_csv(
+        file_name: str, columns: list = None, chunksize: int = default_chunksize):
+    ''' generator reading Airdata UAV - csv flightdata in chunks, so long
+        or concatenated logs are read in bounded memory
+        rows are held back until the first valid gps fix, zero latitude and
+        longitude values are replaced by the first fix as in
+        read_flightdata_csv
+        arguments:
+            file_name: csv filename
+            columns: list of columns to read, None for all flightdata_keys
+            chunksize: number of rows per chunk
+        yields:
+            dict of numpy arrays per column, text columns as object arrays,
+            integer columns with missing values in a chunk as float32 as
+            in read_flightdata_csv
+    '''
+    columns = select_columns(columns)
+    # a chunk cannot be read again once the chunks before it are yielded,
+    # so integer columns are read as floats and made integer again per
+    # chunk if they have no missing values
+    int_dtypes = {
+        key: dtype for key, dtype in get_flightdata_dtypes(columns).items()
+        if dtype.startswith('int')
+    }
+    gps_keys = [
+        key for key in ['latitude', 'longitude'] if columns is None or key in columns
+    ]
+    first_fix = {}
+    held_chunks = []
+    try:
+        reader = pd.read_csv(
+            file_name, skiprows=1, header=None, names=flightdata_keys,
+            index_col=False, usecols=columns, na_values=flightdata_na_values,
+            dtype=get_flightdata_dtypes(columns, int_as_float=True), chunksize=chunksize,
+        )
+        for chunk_df in reader:
+            chunk = {key: np.asarray(chunk_df[key]) for key in chunk_df.columns}
+            for key, dtype in int_dtypes.items():
+                if not np.isnan(chunk[key]).any():
+                    chunk[key] = chunk[key].astype(dtype)
+
+            if len(first_fix) < len(gps_keys):
+                for key in gps_keys:
+                    if key in first_fix:
+                        continue
+
+                    nonzero = np.flatnonzero(chunk[key])
+                    if nonzero.size > 0:
+                        first_fix[key] = chunk[key][nonzero[0]]
+
+                held_chunks.append(chunk)
+                if len(first_fix) < len(gps_keys):
+                    continue
+
+                chunk = {
+                    key: np.concatenate([held[key] for held in held_chunks])
+                    for key in chunk
+                }
+                held_chunks = []
+
+            for key in gps_keys:
+                chunk[key] = np.where(chunk[key] == 0, first_fix[key], chunk[key])
+
+            yield from split_chunk(chunk, chunksize)
+
+    except Exception as e:
+        print(f'unable to read {file_name}, error message: {e}')
+
+    # no valid gps fix in the file, return the rows as they are
+    for chunk in held_chunks:
+        yield chunk
+
+
+def fix_initial_gps(flightdata_df: pd.DataFrame):
+    ''' replace possible initial zero values for lat and long by the first
+        valid value, in place
+    '''
+    for key in ['latitude', 'longitude']:
+        if key in flightdata_df:
+            flightdata_df[key] = flightdata_df[key].replace(
+                0, flightdata_df[key][(flightdata_df[key] != 0).idxmax()])
+
+
+def read_flightdata_csv(
+        file_name: str, columns: list = None, use_cache: bool = True) -> pd.DataFrame:
     ''' read Airdata UAV - csv flightdata
         https://app.airdata.com/
-        argument:
+        the parsed data is cached in cache_folder, next reads of the same
+        unchanged file are taken from the cache
+        arguments:
             filename: csv filename
+            columns: list of columns to read, None for all flightdata_keys
+            use_cache: use and update the on-disk cache, the cache always
+                       holds all columns
         returns:
             pandas df
     '''
+    columns = select_columns(columns)
+    cache_path = None
+    if use_cache:
+        try:
+            cache_path = get_cache_path(file_name)
+
+        except OSError:
+            cache_path = None
+
+    if cache_path and cache_path.is_dir():
+        flightdata_df = read_flightdata_cache(cache_path, columns=columns)
+        if flightdata_df is not None:
+            # the modification time marks the cache as recently used
+            try:
+                os.utime(cache_path)
+
+            except OSError:
+                pass
+
+            return flightdata_df
+
+        shutil.rmtree(cache_path, ignore_errors=True)
+
     empty_df = pd.DataFrame()
     try:
-        flightdata_df = pd.read_csv(
-            file_name, skiprows=1, header=None, names=flightdata_keys, index_col=False,
-        )
+        flightdata_df = parse_flightdata_csv(
+            file_name, columns=None if cache_path else columns)
 
     except Exception as e:
         print(f'unable to read {file_name}, error message: {e}')
         return empty_df
 
-    # replace possible initial zero values for lat and long
-    flightdata_df['latitude'] = flightdata_df['latitude'].replace(
-        0, flightdata_df['latitude'][(flightdata_df != 0)['latitude'].idxmax()])
-    flightdata_df['longitude'] = flightdata_df['longitude'].replace(
-        0, flightdata_df['longitude'][(flightdata_df != 0)['longitude'].idxmax()])
+    if flightdata_df.empty:
+        print(f'no flightdata in {file_name}')
+        return empty_df
+
+    fix_initial_gps(flightdata_df)
+
+    if cache_path:
+        try:
+            write_flightdata_cache(flightdata_df, cache_path)
+            evict_flightdata_cache(cache_path)
+
+        except OSError as e:
+            print(f'unable to write cache {cache_path}, error message: {e}')
+
+        if columns is not None:
+            flightdata_df = flightdata_df[columns]
 
     # returns flightdata dataframe, note it may not contain
     # all the keys
@@ -86,6 +460,7 @@ def read_flightdata_csv(file_name: str) -> pd.DataFrame:
 def main():
     fd_df = read_flightdata_csv(filename)
     print(fd_df.head())
+    print(f'dataframe memory: {fd_df.memory_usage(deep=True).sum():,}')
     process = psutil.Process(os.getpid())
     print(process, f': {process.memory_info().rss:,}')
 
@@ -0,0 +1,85 @@
+''' module for time based playback of dji mavic pro flights
+'''
+import time
+import numpy as np
+
+
+playback_speeds = [1, 2, 5, 10]
+frame_interval = 40  # ms, 25 frames per second
+
+
+class PlaybackClock:
+    ''' maps wall clock time to a flight sample using the time(millisecond)
+        column, so a flight replays at speed times real time independent of
+        how fast the displays render, samples that fall between two frames
+        are skipped
+        methods:
+            start: start playback from a flight position
+            pause: hold the flight position
+            resume: continue from the held flight position
+            seek: move to a flight position, keeping running or paused
+            set_speed: change the playback speed keeping the flight position
+            get_position: current flight position in ms
+            get_index: index of the sample at the current flight position
+            get_index_at: index of the sample at a flight position
+            frame_indices: sample indices for fixed rate frames (offline render)
+            finished: True if the position is past the last sample
+    '''
+
+    def __init__(self, time_ms, speed=1, clock=time.perf_counter):
+        self.time_ms = np.asarray(time_ms, dtype=np.float64)
+        self.speed = speed
+        self.clock = clock
+        self.position = self.time_ms[0] if len(self.time_ms) else 0.0
+        self.ref_wall = None
+        self.running = False
+
+    def start(self, position=None):
+        if position is not None:
+            self.position = position
+
+        self.ref_wall = self.clock()
+        self.running = True
+
+    def pause(self):
+        self.position = self.get_position()
+        self.running = False
+
+    def resume(self):
+        self.start()
+
+    def seek(self, position):
+        self.position = position
+        self.ref_wall = self.clock()
+
+    def set_speed(self, speed):
+        self.position = self.get_position()
+        self.ref_wall = self.clock()
+        self.speed = speed
+
+    def get_position(self) -> float:
+        if not self.running:
+            return self.position
+
+        return self.position + (self.clock() - self.ref_wall) * 1000 * self.speed
+
+    def get_index_at(self, position) -> int:
+        index = np.searchsorted(self.time_ms, position, side='right') - 1
+        return int(min(max(index, 0), len(self.time_ms) - 1))
+
+    def get_index(self) -> int:
+        return self.get_index_at(self.get_position())
+
+    def frame_indices(self, fps):
+        ''' yields the sample index for each frame when rendering at a fixed
+            frame rate, independent of the wall clock
+        '''
+        step = 1000 * self.speed / fps
+        for position in np.arange(self.time_ms[0], self.time_ms[-1] + step, step):
+            yield self.get_index_at(position)
+
+    def finished(self) -> bool:
+        return self.get_position() >= self.time_ms[-1]
+
+    def __repr__(self):
+        return f'playback at {self.speed}x: {self.get_position() / 1000:.1f} s'
@@ -5,12 +5,12 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib import patches as mpl_patches
 from matplotlib import lines as mpl_lines
-from dji_mavic_io import read_flightdata_csv
+from dji_mavic_io import read_flightdata_csv, rc_min, rc_max, rc_zero
+from dji_blit import BlitManager
+from dji_resample import resample_flightdata
+from utils.plogger import profiled
 
 rc_filename = 'dji_mavic_test_data_2.csv'
-rc_max = 1684
-rc_min = 364
-rc_zero = 1024
 
 fig_size = (16.8/2.54, 8.4/2.54)
 rect_carth_offs = 0.09
@@ -42,28 +42,33 @@ class RemoteControlDisplay:
             draw: initial draw of console
             update_stick: update remote control sticks display
             update_bar: update x, y bars of remote controls display
+            set_geometry: precompute stick and bar geometry for all samples
             update: update values for climb, yaw, pitch and roll from fligtdata
+            update_values: update the sticks from raw rc values of a live feed
+            blit_regions: regions and animated artists for the blit manager
             blit: blit the remote control sticks and bars
             on_resize: redraw console on resize
     '''
+    flightdata_columns = ['rc_elevator', 'rc_aileron', 'rc_throttle', 'rc_rudder']
 
     def __init__(self, flightdata_df):
         # get axes from fligh data dataframe
-        self.rc_climb = np.array(flightdata_df['rc_throttle'].to_list(), dtype=np.float64)
-        self.rc_yaw = np.array(flightdata_df['rc_rudder'].to_list(), dtype=np.float64)
+        self.rc_climb = flightdata_df['rc_throttle'].to_numpy(dtype=np.float64, copy=True)
+        self.rc_yaw = flightdata_df['rc_rudder'].to_numpy(dtype=np.float64, copy=True)
         # normalize axises * 100
         self.rc_climb -= rc_zero
         self.rc_climb /= 0.01 * (rc_max - rc_zero)
         self.rc_yaw -= rc_zero
         self.rc_yaw /= 0.01 * (rc_max - rc_zero)
 
-        self.rc_pitch = np.array(flightdata_df['rc_elevator'].to_list(), dtype=np.float64)
-        self.rc_roll = np.array(flightdata_df['rc_aileron'].to_list(), dtype=np.float64)
+        self.rc_pitch = flightdata_df['rc_elevator'].to_numpy(dtype=np.float64, copy=True)
+        self.rc_roll = flightdata_df['rc_aileron'].to_numpy(dtype=np.float64, copy=True)
         # normalize axises * 100
         self.rc_pitch -= rc_zero
         self.rc_pitch /= 0.01 * (rc_max - rc_zero)
         self.rc_roll -= rc_zero
         self.rc_roll /= 0.01 * (rc_max - rc_zero)
+        self.set_geometry()
 
         mpl.rcParams['toolbar'] = 'None'
         self.fig = plt.figure('Remote Control', figsize=fig_size)
@@ -76,11 +81,25 @@ class RemoteControlDisplay:
         self.stick_end = {}
         self.bar_x = {}
         self.bar_y = {}
+        self.stick_data = {}
+        self.bar_x_data = {}
+        self.bar_y_data = {}
         self.setup_rc(title_left, 'left')
         self.setup_rc(title_right, 'right')
 
         connect = self.fig.canvas.mpl_connect
         connect('resize_event', self.on_resize)
+        self.blit_manager = BlitManager([self])
+
+    def set_geometry(self):
+        ''' stick x, y, polar angle (radians) and radius per sample as one
+            contiguous array per stick, so an update is only indexing
+        '''
+        self.geometry = {}
+        for rc_key, x, y in [
+                ('left', self.rc_yaw, self.rc_climb), ('right', self.rc_roll, self.rc_pitch)]:
+            self.geometry[rc_key] = np.ascontiguousarray(
+                np.column_stack((x, y, np.arctan2(y, x), np.hypot(x, y))))
 
     def setup_rc(self, stick_name: str, rc_key: str):
         if rc_key == 'left':
@@ -131,8 +150,13 @@ class RemoteControlDisplay:
             (0, 0), radius=stick_end_size, fc=stick_end_color,
             transform=self.ax_polar[rc_key].transData._b, zorder=10, animated=True,  #pylint: disable=protected-access
         )
+        # vertex buffers of the sticks and bars, updated in place
+        self.stick_data[rc_key] = (np.zeros(2), np.zeros(2))
+        self.bar_x_data[rc_key] = (np.zeros(2), np.full(2, -xymax))
+        self.bar_y_data[rc_key] = (np.full(2, -xymax), np.zeros(2))
         self.stick[rc_key] = mpl_lines.Line2D(
-            [0, 0], [0, 0], linewidth=stick_width, color=stick_color, animated=True,
+            *self.stick_data[rc_key], linewidth=stick_width, color=stick_color,
+            animated=True,
         )
         self.ax_polar[rc_key].add_patch(self.stick_end[rc_key])
         self.ax_polar[rc_key].add_line(self.stick[rc_key])
@@ -140,11 +164,11 @@ class RemoteControlDisplay:
 
         # display of x, y bars
         self.bar_x[rc_key] = mpl_lines.Line2D(
-            [0, 0], [0, 0], linewidth=bar_width, color=bar_color, solid_capstyle='butt',
+            *self.bar_x_data[rc_key], linewidth=bar_width, color=bar_color, solid_capstyle='butt',
             animated=True,
         )
         self.bar_y[rc_key] = mpl_lines.Line2D(
-            [0, 0], [0, 0], linewidth=bar_width, color=bar_color, solid_capstyle='butt',
+            *self.bar_y_data[rc_key], linewidth=bar_width, color=bar_color, solid_capstyle='butt',
             animated=True,
         )
         self.ax_carth[rc_key].add_line(self.bar_x[rc_key])
@@ -158,47 +182,60 @@ class RemoteControlDisplay:
         self.fig.canvas.draw()
         self.fig.canvas.flush_events()
 
-    def update_stick(self, x, y, rc_key):
-        theta, r = conv_xy_to_polar(x, y)
+    def update_stick(self, x, y, rc_key, theta=None, r=None):
+        if theta is None:
+            theta, r = conv_xy_to_polar(x, y)
+            theta = np.radians(theta)
+
         self.stick_end[rc_key].center = (x, y)
-        self.stick[rc_key].set_data([0, np.radians(theta)], [0, r])
+        stick_theta, stick_r = self.stick_data[rc_key]
+        stick_theta[1] = theta
+        stick_r[1] = r
+        self.stick[rc_key].set_data(stick_theta, stick_r)
 
     def update_bar(self, x, y, rc_key):
         # from (0, -xymax) to (x, -xymax)
-        self.bar_x[rc_key].set_data([0, x], [-xymax, -xymax])
+        bar_x, bar_y = self.bar_x_data[rc_key]
+        bar_x[1] = x
+        self.bar_x[rc_key].set_data(bar_x, bar_y)
         # from (xymax, 0) to (xymax, y)
-        self.bar_y[rc_key].set_data([-xymax, -xymax], [0, y])
+        bar_x, bar_y = self.bar_y_data[rc_key]
+        bar_y[1] = y
+        self.bar_y[rc_key].set_data(bar_x, bar_y)
 
+    @profiled('update.RemoteControlDisplay')
     def update(self, index):
-        val1 = self.rc_yaw[index]
-        val2 = self.rc_climb[index]
-        self.update_stick(val1, val2, 'left')
-        self.update_bar(val1, val2, 'left')
+        for rc_key in ['left', 'right']:
+            x, y, theta, r = self.geometry[rc_key][index]
+            self.update_stick(x, y, rc_key, theta=theta, r=r)
+            self.update_bar(x, y, rc_key)
+
+    @profiled('update.RemoteControlDisplay')
+    def update_values(self, rc_elevator, rc_aileron, rc_throttle, rc_rudder):
+        ''' live mode: the sticks show the last sample of the feed, the raw
+            values are in the range rc_min to rc_max
+        '''
+        climb, yaw, pitch, roll = (
+            (np.array([rc_throttle, rc_rudder, rc_elevator, rc_aileron]) - rc_zero) /
+            (0.01 * (rc_max - rc_zero))
+        )
+        for rc_key, x, y in [('left', yaw, climb), ('right', roll, pitch)]:
+            if np.isfinite(x) and np.isfinite(y):
+                self.update_stick(x, y, rc_key)
+                self.update_bar(x, y, rc_key)
+
+    def blit_regions(self):
+        artists = []
+        for rc_key in ['left', 'right']:
+            artists += [
+                self.stick[rc_key], self.stick_end[rc_key],
+                self.bar_x[rc_key], self.bar_y[rc_key],
+            ]
 
-        val1 = self.rc_roll[index]
-        val2 = self.rc_pitch[index]
-        self.update_stick(val1, val2, 'right')
-        self.update_bar(val1, val2, 'right')
+        return [(self.fig.bbox, artists)]
 
     def blit(self):
-        if self.background is None:
-            self.background = (
-                self.fig.canvas.copy_from_bbox(self.fig.bbox)
-            )
-            self.draw()
-
-        else:
-            self.fig.canvas.restore_region(self.background)
-            self.fig.draw_artist(self.stick['left'])
-            self.fig.draw_artist(self.stick_end['left'])
-            self.fig.draw_artist(self.bar_x['left'])
-            self.fig.draw_artist(self.bar_y['left'])
-            self.fig.draw_artist(self.stick['right'])
-            self.fig.draw_artist(self.stick_end['right'])
-            self.fig.draw_artist(self.bar_x['right'])
-            self.fig.draw_artist(self.bar_y['right'])
-            self.fig.canvas.blit()
-            self.fig.canvas.flush_events()
+        self.blit_manager.blit()
 
     def on_resize(self, event):
         self.background = None
@@ -210,15 +247,17 @@ class RemoteControlDisplay:
         return f'Remote Control: left: {title_left}, right: {title_right}'
 
 if __name__ == '__main__':
-    samplerate = 1
-    flightdata_df = read_flightdata_csv('dji_mavic_test_data.csv')
+    rate = 10  # Hz
+    flightdata_df = resample_flightdata(read_flightdata_csv(
+        'dji_mavic_test_data.csv',
+        columns=['time(millisecond)'] + RemoteControlDisplay.flightdata_columns), rate=rate)
     rcd = RemoteControlDisplay(flightdata_df)
     plt.show(block=False)
     plt.pause(0.1)
     print(rcd)
     input('continue to start ...')
 
-    for i in range(0, len(flightdata_df), samplerate):
+    for i in range(len(flightdata_df)):
         rcd.update(i)
         rcd.blit()
 
@@ -0,0 +1,241 @@
+''' headless batch renderer of dji mavic pro flight replays to video or
+    png frames
+'''
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np  #pylint: disable=wrong-import-position
+from PIL import Image  #pylint: disable=wrong-import-position
+from dji_mavic_io import read_flightdata_csv  #pylint: disable=wrong-import-position
+from dji_remote_control import RemoteControlDisplay  #pylint: disable=wrong-import-position
+from dji_flight_graphs import GraphDisplay  #pylint: disable=wrong-import-position
+from dji_map import MapDisplay  #pylint: disable=wrong-import-position
+from dji_playback import PlaybackClock  #pylint: disable=wrong-import-position
+from dji_resample import resample_flightdata  #pylint: disable=wrong-import-position
+import dji_tiles  #pylint: disable=wrong-import-position
+
+
+default_fps = 25
+default_speed = 10
+background_color = 255
+flightdata_columns = (
+    RemoteControlDisplay.flightdata_columns + GraphDisplay.flightdata_columns +
+    MapDisplay.flightdata_columns
+)
+
+
+def get_rgb(fig) -> np.ndarray:
+    ''' rgb view on the agg buffer of a figure, no copy '''
+    return np.asarray(fig.canvas.buffer_rgba())[..., :3]
+
+
+class FrameCompositor:
+    ''' composes the graph display (top left), remote control (bottom left)
+        and map (right) in one preallocated rgb frame
+        methods:
+            compose: copy the current panel buffers in the frame
+    '''
+
+    def __init__(self, gd, rcd, md):
+        gd_h, gd_w, _ = get_rgb(gd.fig).shape
+        rc_h, rc_w, _ = get_rgb(rcd.fig).shape
+        md_h, md_w, _ = get_rgb(md.fig).shape
+        left_w = max(gd_w, rc_w)
+        # even dimensions for yuv420p encoding
+        self.width = (left_w + md_w + 1) // 2 * 2
+        self.height = (max(gd_h + rc_h, md_h) + 1) // 2 * 2
+        self.frame = np.full(
+            (self.height, self.width, 3), background_color, dtype=np.uint8)
+        self.panels = [(gd.fig, 0, 0), (rcd.fig, gd_h, 0), (md.fig, 0, left_w)]
+
+    def compose(self) -> np.ndarray:
+        for fig, row, col in self.panels:
+            rgb = get_rgb(fig)
+            self.frame[row:row + rgb.shape[0], col:col + rgb.shape[1]] = rgb
+
+        return self.frame
+
+
+class FfmpegWriter:
+    ''' pipes raw rgb frames to ffmpeg '''
+
+    def __init__(self, output, width, height, fps):
+        self.process = subprocess.Popen(
+            [
+                'ffmpeg', '-loglevel', 'error', '-y', '-f', 'rawvideo',
+                '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps),
+                '-i', '-', '-c:v', 'libx264', '-pix_fmt', 'yuv420p', str(output),
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, frame):
+        self.process.stdin.write(frame.data)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class PngWriter:
+    ''' writes frames as a numbered png sequence in a folder '''
+
+    def __init__(self, output, width, height, fps):  #pylint: disable=unused-argument
+        self.folder = Path(output)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.frame_number = 0
+
+    def write(self, frame):
+        Image.fromarray(frame).save(self.folder / f'frame_{self.frame_number:06d}.png')
+        self.frame_number += 1
+
+    def close(self):
+        pass
+
+
+writers = {'mp4': FfmpegWriter, 'png': PngWriter}
+
+
+def render_flight(file_name, output, fps=default_fps, speed=default_speed,
+                  output_format='mp4', offline=False, rate=None) -> dict:
+    ''' render a flight replay on agg canvases
+        arguments:
+            file_name: csv filename
+            output: mp4 filename or folder for png frames
+            fps: frames per second of the output
+            speed: playback speed, 10 is ten times real time
+            output_format: mp4 or png
+            offline: use only cached basemap tiles
+            rate: if given, resample the flightdata to rate samples per second
+        returns:
+            dict with file, frames, seconds and error message if any
+    '''
+    start = time.perf_counter()
+    result = {'file': str(file_name), 'frames': 0, 'seconds': 0.0, 'error': None}
+    flightdata_df = read_flightdata_csv(file_name, columns=flightdata_columns)
+    if flightdata_df.empty:
+        result['error'] = 'unable to read flightdata'
+        return result
+
+    if rate:
+        flightdata_df = resample_flightdata(flightdata_df, rate=rate)
+
+    dji_tiles.get_tile_cache().offline = offline
+    rcd = RemoteControlDisplay(flightdata_df)
+    gd = GraphDisplay(flightdata_df, incremental=True)
+    md = MapDisplay(flightdata_df)
+    displays = [rcd, gd, md]
+    for display in displays:
+        display.draw()
+
+    compositor = FrameCompositor(gd, rcd, md)
+    writer = writers[output_format](output, compositor.width, compositor.height, fps)
+    clock = PlaybackClock(
+        flightdata_df['time(millisecond)'].to_numpy(dtype=np.float64), speed=speed)
+    try:
+        for index in clock.frame_indices(fps):
+            rcd.update(index)
+            gd.update(index)
+            md.update_location(index)
+            for display in displays:
+                display.blit()
+
+            writer.write(compositor.compose())
+            result['frames'] += 1
+
+    finally:
+        writer.close()
+        for display in displays:
+            display.remove_fig()
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def render_flight_safe(kwargs) -> dict:
+    ''' render_flight for the process pool, errors do not stop the batch '''
+    try:
+        return render_flight(**kwargs)
+
+    except Exception as e:  #pylint: disable=broad-except
+        return {
+            'file': str(kwargs['file_name']), 'frames': 0, 'seconds': 0.0,
+            'error': str(e),
+        }
+
+
+def get_flight_files(paths) -> list:
+    ''' csv files of the paths, directories are expanded to their csv files '''
+    flight_files = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            flight_files += sorted(path.glob('*.csv'))
+
+        else:
+            flight_files.append(path)
+
+    return flight_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='render flight replays headless')
+    parser.add_argument('paths', nargs='+', help='csv files or directories of csv files')
+    parser.add_argument('--output-dir', default='replays')
+    parser.add_argument('--format', choices=list(writers), default='mp4')
+    parser.add_argument('--fps', type=int, default=default_fps)
+    parser.add_argument('--speed', type=float, default=default_speed)
+    parser.add_argument('--workers', type=int, default=None, help='default number of cores')
+    parser.add_argument(
+        '--offline', action='store_true', help='use only cached basemap tiles')
+    parser.add_argument(
+        '--rate', type=float, default=None,
+        help='resample the flightdata to a uniform rate in Hz before rendering')
+    args = parser.parse_args()
+
+    if args.format == 'mp4' and not shutil.which('ffmpeg'):
+        print('ffmpeg not found, use --format png')
+        sys.exit(1)
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    suffix = '.mp4' if args.format == 'mp4' else ''
+    jobs = [
+        dict(
+            file_name=file_name, output=output_dir / (file_name.stem + suffix),
+            fps=args.fps, speed=args.speed, output_format=args.format,
+            offline=args.offline, rate=args.rate,
+        )
+        for file_name in get_flight_files(args.paths)
+    ]
+
+    start = time.perf_counter()
+    total_frames = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for result in executor.map(render_flight_safe, jobs):
+            if result['error']:
+                print(f'{result["file"]}: error: {result["error"]}')
+                continue
+
+            total_frames += result['frames']
+            print(
+                f'{result["file"]}: {result["frames"]:,} frames in '
+                f'{result["seconds"]:.1f} s, '
+                f'{result["frames"] / result["seconds"]:.1f} frames/s'
+            )
+
+    duration = time.perf_counter() - start
+    print(
+        f'rendered {len(jobs)} flights, {total_frames:,} frames in {duration:.1f} s, '
+        f'{total_frames / duration:.1f} frames/s'
+    )
+
+
+if __name__ == '__main__':
+    main()
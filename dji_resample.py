@@ -0,0 +1,128 @@
+''' module to resample dji mavic pro flightdata on a uniform time grid,
+    Airdata logs have dropouts and jitter in time(millisecond) so stepping
+    by row is not stepping by time
+'''
+import numpy as np
+import pandas as pd
+
+
+default_rate = 10  # Hz, the nominal rate of Airdata logs
+gap_factor = 3  # intervals longer than gap_factor times the median are gaps
+# channels that hold their value until the next sample, other numeric
+# channels are interpolated, text channels always hold
+discrete_columns = [
+    'datetime(utc)', 'satellites', 'gpslevel', 'isPhoto', 'isVideo',
+    'battery_percent', 'flycStateRaw', 'flycState', 'message',
+]
+# angle channels in degrees 0 to 360, interpolated the short way round
+heading_columns = [' compass_heading(degrees)', 'gimbal_heading(degrees)']
+
+
+def get_sorted_time(time_ms) -> tuple:
+    ''' sample order by time with repeated times removed, the first sample
+        of a repeated time is kept
+        returns:
+            indices of the samples in time order, their times
+    '''
+    time_ms = np.asarray(time_ms, dtype=np.float64)
+    order = np.argsort(time_ms, kind='stable')
+    sorted_time = time_ms[order]
+    keep = np.concatenate(([True], np.diff(sorted_time) > 0)) if len(order) else order
+    return order[keep], sorted_time[keep]
+
+
+def get_max_gap(time_ms) -> float:
+    ''' interval in ms above which an interval is a gap '''
+    intervals = np.diff(time_ms)
+    if len(intervals) == 0:
+        return np.inf
+
+    return gap_factor * float(np.median(intervals))
+
+
+def get_gaps(time_ms, max_gap_ms=None) -> np.ndarray:
+    ''' gaps in the samples
+        arguments:
+            time_ms: sample times in ms, sorted
+            max_gap_ms: longest interval that is not a gap, default is
+                        gap_factor times the median interval
+        returns:
+            array of (start_ms, end_ms) of the gaps
+    '''
+    time_ms = np.asarray(time_ms, dtype=np.float64)
+    max_gap_ms = get_max_gap(time_ms) if max_gap_ms is None else max_gap_ms
+    starts = np.flatnonzero(np.diff(time_ms) > max_gap_ms)
+    return np.column_stack((time_ms[starts], time_ms[starts + 1]))
+
+
+def resample_flightdata(flightdata_df: pd.DataFrame, rate=default_rate,
+                        max_gap_ms=None, mask_gaps=False) -> pd.DataFrame:
+    ''' resample flightdata on a uniform time grid, headings are
+        interpolated across the 0/360 wrap
+        arguments:
+            flightdata_df: flightdata with time(millisecond)
+            rate: samples per second of the grid
+            max_gap_ms: longest interval that is not a gap, default is
+                        gap_factor times the median interval
+            mask_gaps: if True the interpolated channels are NaN in gaps
+        returns:
+            dataframe with the same columns and dtypes (interpolated integer
+            channels are rounded) and a boolean gap column that is True for
+            grid times in a gap
+    '''
+    if flightdata_df.empty:
+        return flightdata_df.assign(gap=pd.Series(dtype=bool))
+
+    order, time_ms = get_sorted_time(flightdata_df['time(millisecond)'])
+    step = 1000 / rate
+    grid = time_ms[0] + step * np.arange(int((time_ms[-1] - time_ms[0]) // step) + 1)
+
+    # every grid time lies between a previous and a next sample, the
+    # interpolation weight of the next sample is 0 at the previous sample
+    previous = np.searchsorted(time_ms, grid, side='right') - 1
+    following = np.minimum(previous + 1, len(time_ms) - 1)
+    interval = time_ms[following] - time_ms[previous]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(interval > 0, (grid - time_ms[previous]) / interval, 0.0)
+
+    max_gap_ms = get_max_gap(time_ms) if max_gap_ms is None else max_gap_ms
+    gap = interval > max_gap_ms
+    previous_rows = order[previous]
+    following_rows = order[following]
+
+    resampled = {}
+    for column in flightdata_df.columns:
+        series = flightdata_df[column]
+        if column == 'time(millisecond)':
+            resampled[column] = np.round(grid).astype(series.dtype)
+
+        elif column in discrete_columns or not pd.api.types.is_numeric_dtype(series):
+            resampled[column] = series.iloc[previous_rows].reset_index(drop=True)
+
+        else:
+            values = series.to_numpy(dtype=np.float64)
+            start = values[previous_rows]
+            change = values[following_rows] - start
+            if column in heading_columns:
+                # the change of heading the short way round, so 350 to 10
+                # passes 0 and not 180
+                change = (change + 180) % 360 - 180
+
+            interpolated = start + weight * change
+            if column in heading_columns:
+                interpolated %= 360
+
+            if mask_gaps:
+                interpolated[gap] = np.nan
+
+            if pd.api.types.is_integer_dtype(series) and not mask_gaps:
+                resampled[column] = np.round(interpolated).astype(series.dtype)
+
+            elif pd.api.types.is_float_dtype(series):
+                resampled[column] = interpolated.astype(series.dtype)
+
+            else:
+                resampled[column] = interpolated
+
+    resampled['gap'] = gap
+    return pd.DataFrame(resampled)
@@ -0,0 +1,82 @@
+''' module for simplification of dji mavic pro flight tracks with the
+    Ramer-Douglas-Peucker algorithm, within a distance tolerance
+'''
+import numpy as np
+
+
+default_tolerance = 1.0  # meter
+
+
+def get_distances(points, start, end) -> np.ndarray:
+    ''' distance of points[start + 1:end] to the segment from points[start]
+        to points[end]
+    '''
+    a = points[start]
+    ab = points[end] - a
+    ap = points[start + 1:end] - a
+    length2 = ab @ ab
+    if length2 == 0:
+        return np.sqrt(np.einsum('ij,ij->i', ap, ap))
+
+    t = np.clip(ap @ ab / length2, 0.0, 1.0)
+    d = ap - t[:, None] * ab
+    return np.sqrt(np.einsum('ij,ij->i', d, d))
+
+
+def simplify_track(x, y, z=None, tolerance=default_tolerance) -> np.ndarray:
+    ''' Ramer-Douglas-Peucker simplification of a track, iterative with a
+        stack of segments and the distances per segment vectorized
+        arguments:
+            x, y: track coordinates in meter, for example EPSG:3857
+            z: optional height in the same unit as x and y, so altitude
+               extremes are kept as well as turns
+            tolerance: maximum distance of a dropped point to the simplified
+                       track
+        returns:
+            sorted indices of the kept points, the first (home point) and
+            last point are always kept; points with a non-finite coordinate
+            are left out, the track is simplified over the finite points
+    '''
+    columns = [x, y] if z is None else [x, y, z]
+    points = np.column_stack(columns).astype(np.float64)
+    finite = np.all(np.isfinite(points), axis=1)
+    if not finite.all():
+        # a NaN distance is never above the tolerance and would drop the
+        # points of its whole segment
+        finite_index = np.flatnonzero(finite)
+        return finite_index[simplify_points(points[finite], tolerance)]
+
+    return simplify_points(points, tolerance)
+
+
+def simplify_points(points, tolerance) -> np.ndarray:
+    ''' Ramer-Douglas-Peucker simplification of an array of finite points
+        returns:
+            sorted indices of the kept points
+    '''
+    n_points = len(points)
+    if n_points < 3:
+        return np.arange(n_points)
+
+    keep = np.zeros(n_points, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n_points - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        distances = get_distances(points, start, end)
+        i_max = int(np.argmax(distances))
+        if distances[i_max] > tolerance:
+            index = start + 1 + i_max
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return np.flatnonzero(keep)
+
+
+def get_compression_ratio(n_points, indices) -> float:
+    ''' number of points of the full track per point of the simplified track '''
+    return n_points / len(indices) if len(indices) else 1.0
@@ -0,0 +1,127 @@
+''' module for rolling window statistics over flightdata channels, with
+    O(1) mean, standard deviation, minimum and maximum for any window
+'''
+import numpy as np
+
+
+class SparseTable:
+    ''' range minimum or maximum queries in O(1) after an O(n log n) build,
+        level k holds the reduction of the 2**k samples from each index
+        methods:
+            query: reduction over the samples start up to end (exclusive)
+    '''
+
+    def __init__(self, values, reduce=np.minimum):
+        self.reduce = reduce
+        self.levels = [np.asarray(values)]
+        width = 1
+        while 2 * width <= len(values):
+            previous = self.levels[-1]
+            self.levels.append(reduce(previous[:-width], previous[width:]))
+            width *= 2
+
+    def query(self, start, end):
+        level = int(end - start).bit_length() - 1
+        table = self.levels[level]
+        return self.reduce(table[start], table[end - (1 << level)])
+
+
+class RollingStats:
+    ''' windowed statistics over channels sampled at the same times, using
+        prefix sums of the values and their squares for mean and standard
+        deviation, and sparse tables for minimum and maximum, built per
+        channel on the first query; NaN samples are left out
+        methods:
+            get_window: index range of a time window
+            mean, std, min, max: statistic of a channel over a window
+            stats: all statistics of a channel over a window
+    '''
+
+    def __init__(self, time_s, channels):
+        ''' arguments:
+                time_s: sorted sample times in seconds
+                channels: dict of name: array of values at time_s
+        '''
+        self.time_s = np.asarray(time_s, dtype=np.float64)
+        self.channels = {}
+        self.sums = {}
+        self.squares = {}
+        self.counts = {}
+        self.offsets = {}
+        self.min_tables = {}
+        self.max_tables = {}
+        for name, values in channels.items():
+            values = np.asarray(values, dtype=np.float64)
+            valid = ~np.isnan(values)
+            # sums of values centered on the channel mean keep the
+            # variance accurate for channels with a large offset
+            offset = float(np.mean(values[valid])) if np.any(valid) else 0.0
+            clean = np.where(valid, values - offset, 0.0)
+            self.channels[name] = values
+            self.offsets[name] = offset
+            self.sums[name] = np.concatenate(([0.0], np.cumsum(clean)))
+            self.squares[name] = np.concatenate(([0.0], np.cumsum(clean * clean)))
+            self.counts[name] = np.concatenate(([0], np.cumsum(valid)))
+
+    def get_window(self, end_time, duration):
+        ''' index range (start, end exclusive) of the samples in the time
+            window (end_time - duration, end_time]
+        '''
+        start = np.searchsorted(self.time_s, end_time - duration, side='right')
+        end = np.searchsorted(self.time_s, end_time, side='right')
+        return int(start), int(end)
+
+    def get_count(self, name, start, end):
+        return int(self.counts[name][end] - self.counts[name][start])
+
+    def mean(self, name, start, end):
+        count = self.get_count(name, start, end)
+        if count == 0:
+            return np.nan
+
+        return (self.sums[name][end] - self.sums[name][start]) / count + self.offsets[name]
+
+    def std(self, name, start, end):
+        count = self.get_count(name, start, end)
+        if count == 0:
+            return np.nan
+
+        mean = (self.sums[name][end] - self.sums[name][start]) / count
+        square_mean = (self.squares[name][end] - self.squares[name][start]) / count
+        return np.sqrt(max(square_mean - mean * mean, 0.0))
+
+    def min(self, name, start, end):
+        if end <= start:
+            return np.nan
+
+        if name not in self.min_tables:
+            self.min_tables[name] = SparseTable(
+                np.where(np.isnan(self.channels[name]), np.inf, self.channels[name]),
+                reduce=np.minimum)
+
+        value = self.min_tables[name].query(start, end)
+        return value if np.isfinite(value) else np.nan
+
+    def max(self, name, start, end):
+        if end <= start:
+            return np.nan
+
+        if name not in self.max_tables:
+            self.max_tables[name] = SparseTable(
+                np.where(np.isnan(self.channels[name]), -np.inf, self.channels[name]),
+                reduce=np.maximum)
+
+        value = self.max_tables[name].query(start, end)
+        return value if np.isfinite(value) else np.nan
+
+    def stats(self, name, start, end) -> dict:
+        return {
+            'mean': self.mean(name, start, end),
+            'std': self.std(name, start, end),
+            'min': self.min(name, start, end),
+            'max': self.max(name, start, end),
+        }
+
+    def __repr__(self):
+        return (f'rolling stats of {len(self.time_s):,} samples: '
+                f'{", ".join(self.channels)}')
@@ -0,0 +1,396 @@
+''' module to generate synthetic Airdata csv flight logs with the columns
+    of flightdata_keys, for scale and soak tests of the dji mavic pro
+    displays; the flight is a closed form function of time, so a log is
+    written in chunks of rows and is the same for the same seed
+'''
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from dji_mavic_io import (
+    flightdata_keys, FEET_METER_CONV, MILES_KM_CONV, rc_min, rc_max, rc_zero,
+)
+
+
+default_duration = 900  # seconds
+default_rate = 10  # Hz
+default_home = (51.11217, 9.01737)  # lat, lon
+default_start = '2017-08-29 05:05:00'
+chunk_rows = 50_000
+min_duration = 120  # seconds
+METER_PER_DEGREE = 111_320
+MPS_MPH_CONV = 3.6 / MILES_KM_CONV
+
+# flight schedule in seconds, the return to home and landing are at the end
+motors_time = 3
+takeoff_time = 20
+accelerate_time = 10
+min_rth_time = 30
+rth_speed = 15  # m/s
+rth_fraction = 0.3  # longest return to home as fraction of the flight
+land_speed = 1.5  # m/s
+confirm_time = 3
+
+cruise_height = 35  # meter
+rth_height = 35  # meter
+wander_radius = 3000  # meter
+max_speed = 18  # m/s, Mavic Pro in Sport mode
+speed_margin = 1.0
+sport_speed = 12  # m/s, above this the flight mode is Sport
+ground_elevation = 92  # feet
+cell_count = 3
+
+# flycStateRaw codes and flycState names
+flyc_states = {
+    'motors': (41, 'Motors_Started'),
+    'takeoff': (10, 'Assisted_Takeoff'),
+    'gps': (6, 'P-GPS'),
+    'sport': (31, 'Sport'),
+    'rth': (15, 'Go_Home'),
+    'landing': (12, 'AutoLanding'),
+    'confirm': (33, 'Confirm_Landing'),
+}
+phase_keys = list(flyc_states)
+flyc_state_raw_codes = np.array([code for code, _ in flyc_states.values()], dtype=np.int16)
+flyc_state_names = np.array([name for _, name in flyc_states.values()], dtype=object)
+
+
+def smoothstep(s):
+    s = np.clip(s, 0.0, 1.0)
+    return s * s * (3 - 2 * s)
+
+
+class FlightPlan:
+    ''' the flight as closed form functions of time: motors start, takeoff,
+        a wander around the home point in P-GPS and Sport mode, return to
+        home and landing
+        methods:
+            get_position: x, y (meter east and north of home) and height
+            get_phase: phase per time, an index into phase_keys
+    '''
+
+    def __init__(self, duration=default_duration, seed=0, home=default_home):
+        if duration < min_duration:
+            raise ValueError(
+                f'duration of {duration:.0f} s is shorter than the {min_duration} s '
+                f'needed for takeoff, return to home and landing')
+
+        rng = np.random.default_rng(seed)
+        self.duration = duration
+        self.home = home
+        # sums of sines with random periods and phases for x, y and height
+        n_waves = 3
+        self.periods = rng.uniform(200, 900, size=(2, n_waves))
+        self.phases = rng.uniform(0, 2 * np.pi, size=(2, n_waves))
+        weights = rng.uniform(0.5, 1.0, size=(2, n_waves))
+        self.amplitudes = wander_radius * weights / weights.sum(axis=1, keepdims=True)
+        # scale down so the speed mostly stays below max_speed, the sines
+        # seldom peak together so the bound is loosened by speed_margin
+        speed_bound = np.hypot(*np.sum(self.amplitudes * 2 * np.pi / self.periods, axis=1))
+        self.amplitudes *= min(1.0, speed_margin * max_speed / speed_bound)
+        # and so the return to home at rth_speed fits in rth_fraction of the flight
+        max_offset = np.hypot(*np.sum(2 * self.amplitudes, axis=1))
+        max_rth_offset = rth_fraction * self.duration * rth_speed / 1.5
+        self.amplitudes *= min(1.0, max_rth_offset / max_offset)
+        max_offset = min(max_offset, max_rth_offset)
+
+        # schedule, the fade out of the wander brings the drone home, its
+        # speed is at most 1.5 times the offset divided by the rth time
+        self.t_fly = motors_time + takeoff_time
+        self.t_confirm = self.duration - confirm_time
+        self.t_land = self.t_confirm - rth_height / land_speed
+        self.t_rth = self.t_land - max(min_rth_time, 1.5 * max_offset / rth_speed)
+        self.height_periods = rng.uniform(60, 300, size=n_waves)
+        self.height_phases = rng.uniform(0, 2 * np.pi, size=n_waves)
+        self.height_amplitude = 0.3 * cruise_height / n_waves
+        self.seed = seed
+
+    def get_wander_time(self, t):
+        ''' time along the wander, it starts at t_fly and speeds up over
+            accelerate_time with a smoothstep, so the drone accelerates
+            smoothly from the hover after takeoff
+        '''
+        u = np.clip((np.asarray(t, dtype=np.float64) - self.t_fly) / accelerate_time, 0, None)
+        ramp = np.minimum(u, 1.0)
+        return accelerate_time * (ramp**3 - ramp**4 / 2 + np.maximum(u - 1, 0.0))
+
+    def get_wander(self, t):
+        s = self.get_wander_time(t)[:, None]
+        x, y = (
+            np.sum(self.amplitudes[i] * (
+                np.sin(2 * np.pi * s / self.periods[i] + self.phases[i]) -
+                np.sin(self.phases[i])), axis=1)
+            for i in range(2)
+        )
+        return x, y
+
+    def get_fly_height(self, t):
+        s = np.asarray(t, dtype=np.float64)[:, None] - self.t_fly
+        return cruise_height + np.sum(self.height_amplitude * np.sin(
+            2 * np.pi * s / self.height_periods + self.height_phases), axis=1)
+
+    def get_position(self, t) -> tuple:
+        t = np.asarray(t, dtype=np.float64)
+
+        # horizontal: wander after takeoff, during the return to home the
+        # wander holds and fades out to the home point
+        x, y = self.get_wander(np.minimum(t, self.t_rth))
+        fade_out = 1 - smoothstep((t - self.t_rth) / (self.t_land - self.t_rth))
+        x, y = x * fade_out, y * fade_out
+
+        # height: climb, wander, go to the rth height, descend
+        h_fly_start, h_rth_start = self.get_fly_height([self.t_fly, self.t_rth])
+        height = np.select(
+            [t < motors_time, t < self.t_fly, t < self.t_rth, t < self.t_land,
+             t < self.t_confirm],
+            [
+                0.0,
+                h_fly_start * smoothstep((t - motors_time) / takeoff_time),
+                self.get_fly_height(t),
+                h_rth_start + (rth_height - h_rth_start) * smoothstep((t - self.t_rth) / 10),
+                rth_height * (1 - (t - self.t_land) / (self.t_confirm - self.t_land)),
+            ],
+            default=0.0,
+        )
+        return x, y, np.maximum(height, 0.0)
+
+    def get_phase(self, t, speed) -> np.ndarray:
+        t = np.asarray(t, dtype=np.float64)
+        return np.select(
+            [t < motors_time, t < self.t_fly, (t < self.t_rth) & (speed > sport_speed),
+             t < self.t_rth, t < self.t_land, t < self.t_confirm],
+            [phase_keys.index(key) for key in
+             ['motors', 'takeoff', 'sport', 'gps', 'rth', 'landing']],
+            default=phase_keys.index('confirm'),
+        )
+
+    def __repr__(self):
+        return (f'flight plan of {self.duration:.0f} s, seed {self.seed}, '
+                f'return to home at {self.t_rth:.0f} s')
+
+
+def get_stick(value, full_scale):
+    ''' stick position for a value, full_scale gives full deflection '''
+    deflection = np.clip(value / full_scale, -1, 1) * (rc_max - rc_zero)
+    return np.clip(np.round(rc_zero + deflection), rc_min, rc_max).astype(np.int16)
+
+
+def get_chunk(plan, start, stop, rate, start_time, running_max) -> pd.DataFrame:
+    ''' rows start up to stop of the log
+        arguments:
+            plan: FlightPlan
+            start, stop: row numbers
+            rate: rows per second
+            start_time: pd.Timestamp of the first row
+            running_max: dict of running maxima, updated for the next chunk
+        returns:
+            dataframe with the flightdata_keys columns
+    '''
+    rng = np.random.default_rng([plan.seed, start])
+    n_rows = stop - start
+    rows = np.arange(start, stop)
+    t = rows / rate
+    dt = 1 / rate
+    x, y, height = plan.get_position(t)
+    x0, y0, height0 = plan.get_position(t - dt)
+    x00, y00, _ = plan.get_position(t - 2 * dt)
+    vx, vy, vz = (x - x0) / dt, (y - y0) / dt, (height - height0) / dt
+    speed = np.hypot(vx, vy)
+    # headings are -180 to 180 here and written 0 to 360 as Airdata does
+    heading = np.degrees(np.arctan2(vx, vy))
+    previous_heading = np.degrees(np.arctan2(x0 - x00, y0 - y00))
+    yaw_rate = (heading - previous_heading + 180) % 360 - 180
+    yaw_rate = np.where(speed > 0.5, yaw_rate / dt, 0.0)
+    phase = plan.get_phase(t, speed)
+    airborne = height > 0
+
+    # battery: linear discharge with a sag under load
+    fraction = t / plan.duration
+    flying = airborne | (phase == phase_keys.index('takeoff'))
+    current = np.where(
+        phase == phase_keys.index('motors'), 2.0,
+        np.where(flying, 7.5 + 0.25 * speed + 1.5 * np.abs(vz), 0.0))
+    current = np.round(current + rng.normal(0, 0.1, n_rows) * (current > 0), 3)
+    cell = 4.2 - 0.65 * fraction - 0.01 * current
+    cells = np.round(cell[:, None] + rng.normal(0, 0.004, (n_rows, cell_count)), 3)
+    voltage = np.round(cells.sum(axis=1), 3)
+
+    # running maxima continue over the chunks
+    altitude = ground_elevation + height / FEET_METER_CONV
+    distance = np.hypot(x, y) / FEET_METER_CONV
+    speed_mph = speed * MPS_MPH_CONV
+    maxima = {}
+    for key, values in [
+            ('max_altitude(feet)', altitude), ('max_ascent(feet)', height / FEET_METER_CONV),
+            ('max_speed(mph)', speed_mph), ('max_distance(feet)', distance)]:
+        maxima[key] = np.maximum.accumulate(np.maximum(values, running_max.get(key, 0.0)))
+        running_max[key] = maxima[key][-1]
+
+    # sticks: manual in P-GPS and Sport, centered in automatic modes, the
+    # motors are started with both sticks down and out
+    manual = (phase == phase_keys.index('gps')) | (phase == phase_keys.index('sport'))
+    heading_rad = np.radians(heading)
+    forward = vx * np.sin(heading_rad) + vy * np.cos(heading_rad)
+    motors_combo = t < 1
+    rc = {
+        'rc_elevator': np.where(manual, get_stick(forward, 2 * sport_speed), rc_zero),
+        'rc_aileron': np.where(manual, get_stick(yaw_rate * speed, 200), rc_zero),
+        'rc_throttle': np.where(manual, get_stick(vz, 4), rc_zero),
+        'rc_rudder': np.where(manual, get_stick(yaw_rate, 90), rc_zero),
+    }
+    for key, value in [('rc_elevator', rc_min), ('rc_aileron', rc_max),
+                       ('rc_throttle', rc_min), ('rc_rudder', rc_min)]:
+        rc[key] = np.where(motors_combo, value, rc[key]).astype(np.int16)
+
+    messages = np.full(n_rows, '', dtype=object)
+    messages[rows == int(plan.t_fly * rate)] = 'Home Point Recorded. RTH Altitude: 35m.'
+    messages[rows == int(plan.t_rth * rate)] = 'Returning to home.'
+    photo = (rng.random(n_rows) < 0.002) & manual
+    # datetime(utc) has a resolution of seconds, format each second once
+    seconds, second_index = np.unique(np.floor(t).astype(np.int64), return_inverse=True)
+    times = (start_time + pd.to_timedelta(seconds, unit='s')).strftime('%Y-%m-%d %H:%M:%S')
+
+    chunk = {
+        'time(millisecond)': np.round(t * 1000).astype(np.int64),
+        'datetime(utc)': np.asarray(times)[second_index],
+        'latitude': np.round(plan.home[0] + y / METER_PER_DEGREE, 8),
+        'longitude': np.round(
+            plan.home[1] + x / (METER_PER_DEGREE * np.cos(np.radians(plan.home[0]))), 8),
+        'height_above_takeoff(feet)': height / FEET_METER_CONV,
+        'height_above_ground_at_drone_location(feet)': np.nan,
+        'ground_elevation_at_drone_location(feet)': np.nan,
+        'altitude_above_seaLevel(feet)': altitude,
+        'height_sonar(feet)': np.where(height < 5, height / FEET_METER_CONV, 0.0),
+        'speed(mph)': speed_mph,
+        'distance(feet)': distance,
+        'satellites': rng.integers(17, 20, n_rows),
+        'gpslevel': np.where(t < motors_time, 4, 5),
+        'voltage(v)': voltage,
+        **maxima,
+        ' xSpeed(mph)': vy * MPS_MPH_CONV,
+        ' ySpeed(mph)': vx * MPS_MPH_CONV,
+        ' zSpeed(mph)': -vz * MPS_MPH_CONV,
+        ' compass_heading(degrees)': np.round(heading, 1) % 360,
+        ' pitch(degrees)': np.round(-0.8 * speed, 1),
+        ' roll(degrees)': np.round(np.clip(yaw_rate * speed / 30, -30, 30), 1),
+        'isPhoto': photo.astype(np.int8),
+        'isVideo': (airborne & (t > plan.t_fly) & (t < plan.t_land)).astype(np.int8),
+        **rc,
+        'gimbal_heading(degrees)': np.round(heading, 1) % 360,
+        'gimbal_pitch(degrees)': np.where(airborne, -22.0, 0.0),
+        'battery_percent': np.round(99 - 75 * fraction).astype(np.int8),
+        **{f'voltageCell{i + 1}': cells[:, i] if i < cell_count else 0.0 for i in range(6)},
+        'current(A)': current,
+        'battery_temperature(f)': np.round(85 + 45 * smoothstep(fraction * 3), 2),
+        'altitude(feet)': altitude,
+        'ascent(feet)': height / FEET_METER_CONV,
+        'flycStateRaw': flyc_state_raw_codes[phase],
+        'flycState': flyc_state_names[phase],
+        'message': messages,
+    }
+    # rounded values are written in their shortest form without a float format
+    return pd.DataFrame(
+        {key: np.round(value, 6) if key not in ['latitude', 'longitude'] and
+         np.asarray(value).dtype == np.float64 else value for key, value in chunk.items()},
+        columns=flightdata_keys)
+
+
+def generate_flight(file_name, duration=default_duration, rate=default_rate, seed=0,
+                    home=default_home, start=default_start) -> int:
+    ''' write a synthetic flight log, chunk by chunk so the size of the log
+        is not limited by memory
+        arguments:
+            file_name: csv filename
+            duration: seconds of flight, at least min_duration
+            rate: rows per second
+            seed: random seed, the same seed gives the same log
+            home: (lat, lon) of the home point
+            start: utc start time of the flight
+        returns:
+            number of rows
+    '''
+    plan = FlightPlan(duration=duration, seed=seed, home=home)
+    n_rows = int(round(plan.duration * rate))
+    start_time = pd.Timestamp(start)
+    running_max = {}
+    with open(file_name, 'w', newline='') as f:
+        for chunk_start in range(0, n_rows, chunk_rows):
+            chunk_df = get_chunk(
+                plan, chunk_start, min(chunk_start + chunk_rows, n_rows), rate,
+                start_time, running_max)
+            chunk_df.to_csv(f, header=chunk_start == 0, index=False)
+
+    return n_rows
+
+
+def generate_flight_kwargs(kwargs) -> int:
+    return generate_flight(**kwargs)
+
+
+def generate_folder(folder, files, duration=default_duration, rate=default_rate,
+                    seed=0, workers=None) -> int:
+    ''' write a folder of synthetic logs in a process pool, the duration
+        varies per file by up to 30% but not below min_duration, the home
+        point and start time vary as well
+        returns:
+            total number of rows
+    '''
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    if duration < min_duration:
+        raise ValueError(f'duration of {duration:.0f} s is shorter than {min_duration} s')
+
+    durations = np.maximum(duration * rng.uniform(0.7, 1.3, files), min_duration)
+    homes = np.column_stack((
+        default_home[0] + rng.uniform(-1, 1, files), default_home[1] + rng.uniform(-1, 1, files)))
+    starts = pd.Timestamp(default_start) + pd.to_timedelta(
+        np.sort(rng.uniform(0, 365 * 24 * 3600, files)).astype(np.int64), unit='s')
+    jobs = [
+        dict(
+            file_name=folder / f'flight_{i:05d}.csv', duration=float(durations[i]),
+            rate=rate, seed=seed + i + 1, home=tuple(homes[i]), start=starts[i].isoformat(),
+        )
+        for i in range(files)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(generate_flight_kwargs, jobs, chunksize=16))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='generate synthetic Airdata flight logs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    flight_parser = subparsers.add_parser('flight', help='one log')
+    flight_parser.add_argument('file_name')
+    folder_parser = subparsers.add_parser('folder', help='a folder of logs')
+    folder_parser.add_argument('folder')
+    folder_parser.add_argument('--files', type=int, default=100)
+    folder_parser.add_argument('--workers', type=int, default=None, help='default number of cores')
+    for sub_parser in [flight_parser, folder_parser]:
+        sub_parser.add_argument(
+            '--duration', type=float, default=default_duration, help='seconds of flight')
+        sub_parser.add_argument('--rows', type=int, help='number of rows, overrides duration')
+        sub_parser.add_argument('--rate', type=float, default=default_rate, help='rows per second')
+        sub_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    duration = args.rows / args.rate if args.rows else args.duration
+    if duration < min_duration:
+        parser.error(
+            f'a flight needs at least {min_duration} s, {int(min_duration * args.rate):,} '
+            f'rows at {args.rate:g} Hz')
+
+    if args.command == 'flight':
+        rows = generate_flight(args.file_name, duration=duration, rate=args.rate, seed=args.seed)
+        print(f'{args.file_name}: {rows:,} rows')
+
+    else:
+        rows = generate_folder(
+            args.folder, args.files, duration=duration, rate=args.rate, seed=args.seed,
+            workers=args.workers)
+        print(f'{args.folder}: {args.files:,} files, {rows:,} rows')
+
+
+if __name__ == '__main__':
+    main()
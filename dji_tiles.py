@@ -0,0 +1,456 @@
+''' module for a local cache of xyz basemap tiles for dji mavic pro
+'''
+import io
+import os
+import json
+import hashlib
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from decouple import config
+import numpy as np
+import requests
+import mercantile
+from PIL import Image
+import contextily as ctx
+
+
+tile_cache_file = Path.home() / '.cache' / 'dji_mavic' / 'tiles.sqlite'
+tile_cache_max_bytes = 512 * 1024**2
+tile_cache_offline = config('TILE_CACHE_OFFLINE', default=False, cast=bool)
+tile_size = 256
+request_timeout = 10  # seconds
+user_agent = 'dji_mavic flight viewer'
+mosaic_folder = Path.home() / '.cache' / 'dji_mavic' / 'mosaics'
+mosaic_max_files = 50
+mosaic_padding = 1  # tiles
+default_source = ctx.providers.OpenStreetMap.Mapnik
+
+
+def read_json_maptiler(json_file):
+    try:
+        with open(json_file) as f:
+            maptiler_source = json.load(f)
+            maptiler_source['url'] = ''.join([
+                maptiler_source['url'], '?key=', config('MAPTILER_API_KEY')
+            ])
+            return maptiler_source
+
+    except (KeyError, FileNotFoundError):
+        return None
+
+
+def get_source(source=None) -> dict:
+    ''' resolve a tile source
+        argument:
+            source: None for OpenStreetMap, name of a tilejson file or a
+                    provider dict with at least an url template
+        returns:
+            provider dict
+    '''
+    if source is None:
+        return default_source
+
+    if isinstance(source, (str, Path)):
+        maptiler_source = read_json_maptiler(source)
+        return maptiler_source if maptiler_source else default_source
+
+    return source
+
+
+def get_provider_name(source: dict) -> str:
+    ''' key of the provider in the cache, the url template without api key
+    '''
+    return source.get('name') or source['url'].split('?')[0]
+
+
+def get_tile_url(source: dict, z: int, x: int, y: int) -> str:
+    subdomains = source.get('subdomains', 'abc')
+    keys = {**source, 's': subdomains[(x + y) % len(subdomains)], 'r': ''}
+    keys.update(x=x, y=y, z=z)
+    return source['url'].format(**keys)
+
+
+def calculate_zoom(west, south, east, north, source=None) -> int:
+    ''' zoom level for a lon/ lat bounding box, same rule as contextily
+    '''
+    zoom_lon = np.ceil(np.log2(360 * 2.0 / (east - west)))
+    zoom_lat = np.ceil(np.log2(360 * 2.0 / (north - south)))
+    zoom = int(max(zoom_lon, zoom_lat))
+    if source:
+        zoom = min(zoom, int(source.get('max_zoom', source.get('maxzoom', zoom))))
+
+    return zoom
+
+
+def get_tile_range(west, south, east, north, zoom) -> tuple:
+    ''' range of xyz tiles covering a lon/ lat bounding box
+        returns:
+            (x_min, y_min, x_max, y_max) in tile numbers
+    '''
+    upper_left = mercantile.tile(west, north, zoom)
+    lower_right = mercantile.tile(east, south, zoom)
+    return upper_left.x, upper_left.y, lower_right.x, lower_right.y
+
+
+def get_tile_range_extent(zoom, tile_range) -> tuple:
+    ''' web mercator extent (xmin, xmax, ymin, ymax) of a tile range '''
+    x_min, y_min, x_max, y_max = tile_range
+    upper_left = mercantile.xy_bounds(x_min, y_min, zoom)
+    lower_right = mercantile.xy_bounds(x_max, y_max, zoom)
+    return upper_left.left, lower_right.right, lower_right.bottom, upper_left.top
+
+
+class TileCache:
+    ''' persistent store of xyz tiles keyed by provider, z, x, y, with a size
+        cap and least recently used eviction
+        methods:
+            get_tile: tile image bytes, from the cache or from the provider
+            fetch_tile: fetch a tile from the provider
+            evict: remove least recently used tiles above the size cap
+            prefetch: warm the cache for a bounding box and zoom range
+            stitch: stitched image for a tile range
+            bounds2img: stitched image and extent for a bounding box
+            info: number of tiles and bytes in the cache
+    '''
+
+    def __init__(self, cache_file=tile_cache_file, max_bytes=tile_cache_max_bytes,
+                 offline=tile_cache_offline):
+        self.cache_file = Path(cache_file)
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.cache_file), check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS tiles ('
+            'provider TEXT, z INTEGER, x INTEGER, y INTEGER, data BLOB, '
+            'size INTEGER, last_access REAL, PRIMARY KEY (provider, z, x, y))'
+        )
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS tiles_last_access ON tiles (last_access)')
+        self.db.commit()
+        self.total_bytes = self.db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM tiles').fetchone()[0]
+
+    def get_tile(self, source: dict, z: int, x: int, y: int) -> bytes:
+        ''' returns the tile image bytes or None if the tile is not available
+        '''
+        provider = get_provider_name(source)
+        with self.lock:
+            row = self.db.execute(
+                'SELECT data FROM tiles WHERE provider=? AND z=? AND x=? AND y=?',
+                (provider, z, x, y)).fetchone()
+            if row:
+                self.db.execute(
+                    'UPDATE tiles SET last_access=? '
+                    'WHERE provider=? AND z=? AND x=? AND y=?',
+                    (time.time(), provider, z, x, y))
+                self.db.commit()
+                return row[0]
+
+        if self.offline:
+            return None
+
+        data = self.fetch_tile(source, z, x, y)
+        if data is None:
+            return None
+
+        with self.lock:
+            # the tile can be stored meanwhile by another thread, the size
+            # of the replaced tile no longer counts
+            row = self.db.execute(
+                'SELECT size FROM tiles WHERE provider=? AND z=? AND x=? AND y=?',
+                (provider, z, x, y)).fetchone()
+            self.db.execute(
+                'INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (provider, z, x, y, data, len(data), time.time()))
+            self.db.commit()
+            self.total_bytes += len(data) - (row[0] if row else 0)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+        return data
+
+    def fetch_tile(self, source: dict, z: int, x: int, y: int) -> bytes:
+        url = get_tile_url(source, z, x, y)
+        try:
+            response = self.session.get(url, timeout=request_timeout)
+            response.raise_for_status()
+
+        except requests.RequestException as e:
+            print(f'unable to fetch tile {z}/{x}/{y}, error message: {e}')
+            return None
+
+        return response.content
+
+    def evict(self):
+        ''' remove least recently used tiles until the cache is at 90% of
+            the size cap, must be called with the lock held
+        '''
+        target_bytes = 0.9 * self.max_bytes
+        rows = self.db.execute(
+            'SELECT rowid, size FROM tiles ORDER BY last_access').fetchall()
+        rowids = []
+        for rowid, size in rows:
+            if self.total_bytes <= target_bytes:
+                break
+
+            rowids.append((rowid,))
+            self.total_bytes -= size
+
+        self.db.executemany('DELETE FROM tiles WHERE rowid=?', rowids)
+        self.db.commit()
+
+    def prefetch(self, west, south, east, north, zooms, source=None) -> int:
+        ''' fetch all tiles for a lon/ lat bounding box
+            arguments:
+                west, south, east, north: bounding box in degrees
+                zooms: iterable of zoom levels
+                source: tile source, see get_source
+            returns:
+                number of tiles available in the cache
+        '''
+        source = get_source(source)
+        available = 0
+        for zoom in zooms:
+            for tile in mercantile.tiles(west, south, east, north, zooms=zoom):
+                if self.get_tile(source, tile.z, tile.x, tile.y) is not None:
+                    available += 1
+
+        return available
+
+    def stitch(self, source: dict, zoom: int, tile_range: tuple, cancel=None):
+        ''' stitch the tiles of a tile range into one image, tiles that are
+            not available are left transparent
+            arguments:
+                source: provider dict
+                zoom: zoom level
+                tile_range: (x_min, y_min, x_max, y_max) in tile numbers
+                cancel: optional threading.Event, when set the remaining
+                        tiles are skipped
+            returns:
+                image as rgba array, number of missing tiles
+        '''
+        x_min, y_min, x_max, y_max = tile_range
+        img = np.zeros(
+            ((y_max - y_min + 1) * tile_size, (x_max - x_min + 1) * tile_size, 4),
+            dtype=np.uint8
+        )
+        missing = 0
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                if cancel is not None and cancel.is_set():
+                    missing += 1
+                    continue
+
+                data = self.get_tile(source, zoom, x, y)
+                if data is None:
+                    missing += 1
+                    continue
+
+                tile_img = Image.open(io.BytesIO(data)).convert('RGBA')
+                if tile_img.size != (tile_size, tile_size):
+                    tile_img = tile_img.resize((tile_size, tile_size))
+
+                row = (y - y_min) * tile_size
+                col = (x - x_min) * tile_size
+                img[row:row + tile_size, col:col + tile_size] = np.asarray(tile_img)
+
+        return img, missing
+
+    def bounds2img(self, west, south, east, north, zoom=None, source=None, cancel=None):
+        ''' stitch the tiles for a lon/ lat bounding box into one image in
+            web mercator (EPSG:3857), tiles that are not available are left
+            transparent
+            arguments:
+                west, south, east, north: bounding box in degrees
+                zoom: zoom level, None to calculate from the bounding box
+                source: tile source, see get_source
+                cancel: optional threading.Event to stop fetching tiles
+            returns:
+                image as rgba array, extent (xmin, xmax, ymin, ymax)
+        '''
+        source = get_source(source)
+        if zoom is None:
+            zoom = calculate_zoom(west, south, east, north, source)
+
+        tile_range = get_tile_range(west, south, east, north, zoom)
+        img, _ = self.stitch(source, zoom, tile_range, cancel=cancel)
+        return img, get_tile_range_extent(zoom, tile_range)
+
+    def info(self):
+        with self.lock:
+            tiles, size = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tiles').fetchone()
+
+        return tiles, size
+
+    def close(self):
+        self.db.close()
+
+    def __repr__(self):
+        tiles, size = self.info()
+        mode = 'offline' if self.offline else 'online'
+        return f'tile cache {self.cache_file} ({mode}): {tiles:,} tiles, {size:,} bytes'
+
+
+class MosaicCache:
+    ''' cache of stitched basemap images, keyed by provider, zoom and the
+        tile range, so flights at the same site reuse the same mosaic
+        mosaics are stored with mosaic_padding extra tiles on each side and
+        only when all tiles were available
+        methods:
+            find: cached mosaic containing a tile range
+            bounds2img: image and extent for a bounding box, cropped from a
+                        cached mosaic or stitched from the tile cache
+            evict: remove least recently used mosaics above the count cap
+    '''
+
+    def __init__(self, tile_cache: TileCache, folder=mosaic_folder,
+                 max_files=mosaic_max_files):
+        self.tile_cache = tile_cache
+        self.folder = Path(folder)
+        self.max_files = max_files
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def get_prefix(self, source: dict, zoom: int) -> str:
+        provider = hashlib.sha1(get_provider_name(source).encode()).hexdigest()[:16]
+        return f'{provider}_{zoom}'
+
+    def find(self, source: dict, zoom: int, tile_range: tuple):
+        ''' returns path and tile range of a cached mosaic that contains
+            tile_range or None, None
+        '''
+        x_min, y_min, x_max, y_max = tile_range
+        for mosaic_file in self.folder.glob(self.get_prefix(source, zoom) + '_*.npy'):
+            mosaic_range = tuple(int(v) for v in mosaic_file.stem.split('_')[2:])
+            if (mosaic_range[0] <= x_min and mosaic_range[1] <= y_min and
+                    mosaic_range[2] >= x_max and mosaic_range[3] >= y_max):
+                return mosaic_file, mosaic_range
+
+        return None, None
+
+    def bounds2img(self, west, south, east, north, zoom=None, source=None, cancel=None):
+        ''' same as TileCache.bounds2img, but cropped from a cached mosaic
+            if one covers the bounding box
+        '''
+        source = get_source(source)
+        if zoom is None:
+            zoom = calculate_zoom(west, south, east, north, source)
+
+        tile_range = get_tile_range(west, south, east, north, zoom)
+        mosaic_file, mosaic_range = self.find(source, zoom, tile_range)
+        if mosaic_file:
+            try:
+                mosaic = np.load(mosaic_file, mmap_mode='r')
+                os.utime(mosaic_file)
+
+            except (OSError, ValueError) as e:
+                print(f'unable to read mosaic {mosaic_file}, error message: {e}')
+                mosaic_file = None
+
+        if not mosaic_file:
+            max_tile = 2**zoom - 1
+            mosaic_range = (
+                max(tile_range[0] - mosaic_padding, 0),
+                max(tile_range[1] - mosaic_padding, 0),
+                min(tile_range[2] + mosaic_padding, max_tile),
+                min(tile_range[3] + mosaic_padding, max_tile),
+            )
+            mosaic, missing = self.tile_cache.stitch(
+                source, zoom, mosaic_range, cancel=cancel)
+            if missing == 0:
+                self.store(mosaic, source, zoom, mosaic_range)
+
+        row = (tile_range[1] - mosaic_range[1]) * tile_size
+        col = (tile_range[0] - mosaic_range[0]) * tile_size
+        rows = (tile_range[3] - tile_range[1] + 1) * tile_size
+        cols = (tile_range[2] - tile_range[0] + 1) * tile_size
+        img = np.array(mosaic[row:row + rows, col:col + cols])
+        return img, get_tile_range_extent(zoom, tile_range)
+
+    def store(self, mosaic: np.ndarray, source: dict, zoom: int, mosaic_range: tuple):
+        name = '_'.join([self.get_prefix(source, zoom), *[str(v) for v in mosaic_range]])
+        tmp_file = self.folder / f'{name}.tmp{os.getpid()}'
+        try:
+            with open(tmp_file, 'wb') as f:
+                np.save(f, mosaic)
+
+            tmp_file.replace(self.folder / f'{name}.npy')
+
+        except OSError as e:
+            print(f'unable to store mosaic {name}, error message: {e}')
+            return
+
+        self.evict()
+
+    def evict(self):
+        mosaic_files = sorted(
+            self.folder.glob('*.npy'), key=lambda mosaic_file: mosaic_file.stat().st_mtime)
+        for mosaic_file in mosaic_files[:max(len(mosaic_files) - self.max_files, 0)]:
+            mosaic_file.unlink()
+
+    def __repr__(self):
+        return f'mosaic cache {self.folder}: {len(list(self.folder.glob("*.npy")))} mosaics'
+
+
+_tile_cache = None
+_mosaic_cache = None
+
+
+def get_tile_cache() -> TileCache:
+    ''' shared tile cache of the application '''
+    global _tile_cache  #pylint: disable=global-statement
+    if _tile_cache is None:
+        _tile_cache = TileCache()
+
+    return _tile_cache
+
+
+def get_mosaic_cache() -> MosaicCache:
+    ''' shared mosaic cache of the application '''
+    global _mosaic_cache  #pylint: disable=global-statement
+    if _mosaic_cache is None:
+        _mosaic_cache = MosaicCache(get_tile_cache())
+
+    return _mosaic_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description='basemap tile cache')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('info', help='show number of tiles and size of the cache')
+    prefetch_parser = subparsers.add_parser(
+        'prefetch', help='warm the cache for a bounding box and zoom range')
+    prefetch_parser.add_argument(
+        'bbox', type=float, nargs=4, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'),
+        help='bounding box in degrees')
+    prefetch_parser.add_argument(
+        '--zoom', type=int, nargs=2, default=(12, 17), metavar=('MIN', 'MAX'))
+    prefetch_parser.add_argument(
+        '--source', default=None,
+        help='tilejson file (e.g. maptiler_hybrid.json) or url template, '
+             'default OpenStreetMap')
+    args = parser.parse_args()
+
+    tile_cache = TileCache()
+    if args.command == 'prefetch':
+        source = args.source
+        if source and '{z}' in source:
+            source = {'url': source}
+
+        available = tile_cache.prefetch(
+            *args.bbox, zooms=range(args.zoom[0], args.zoom[1] + 1), source=source)
+        print(f'tiles available: {available:,}')
+
+    print(tile_cache)
+
+
+if __name__ == '__main__':
+    main()
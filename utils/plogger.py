@@ -1,12 +1,19 @@
 from functools import wraps
+from contextlib import contextmanager
+import json
 import logging
 import time
+import numpy as np
 '''  plogger is a module with logging tools which can be either called directly
      or to be used as decorators
 
      timed - logs the time duration of a decorated function
      func_args - logs the arguments (*args, **kwargs) and results of a
                  decorated function
+     Profiler - aggregates call times and counters in memory, switched on
+                and off at runtime
+     profiled - records the call times of a decorated function in the Profiler
+     profile_block - records the time of a with block in the Profiler
 
 '''
 class Logger:
@@ -44,10 +51,10 @@ def timed(func, logger, print_log=False):
     """This decorator logs the execution time for the decorated function."""
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start = time.time()
+        start = time.perf_counter_ns()
         result = func(*args, **kwargs)
-        end = time.time()
-        log_str = f'==> {func.__name__} ran in {round(end - start, 3)} s'
+        end = time.perf_counter_ns()
+        log_str = f'==> {func.__name__} ran in {(end - start) / 1e9:.6f} s'
         logger.info(log_str)
         if print_log:
             print(log_str)
@@ -66,3 +73,133 @@ def func_args(func, logger):
                     format(func.__name__, args, kwargs, result))
         return result
     return wrapper
+
+
+class Histogram:
+    ''' call times in ns of one call site, the percentiles are of the last
+        size calls, the count, total and maximum of all calls
+    '''
+    size = 4096
+
+    def __init__(self):
+        self.samples = np.zeros(self.size, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ns):
+        self.samples[self.count % self.size] = ns
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def stats(self):
+        ''' statistics in ms '''
+        samples = self.samples[:min(self.count, self.size)]
+        p50, p95, p99 = (0, 0, 0)
+        if len(samples):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) / 1e6
+
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count / 1e6 if self.count else 0.0,
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'max_ms': self.max / 1e6,
+        }
+
+
+class Profiler:
+    ''' in memory profiler for hot paths, when disabled a profiled call
+        costs one attribute check
+        methods:
+            enable: switch recording on or off
+            record: add a call time in ns for a name
+            count: add to a counter
+            stats: histogram statistics and counters
+            summary: short text of the p50 and p95 of names
+            dump: write the stats to a json file
+            reset: clear all histograms and counters
+    '''
+    enabled = False
+    histograms = {}
+    counters = {}
+
+    @classmethod
+    def enable(cls, enabled=True):
+        cls.enabled = enabled
+
+    @classmethod
+    def record(cls, name, ns):
+        histogram = cls.histograms.get(name)
+        if histogram is None:
+            histogram = cls.histograms[name] = Histogram()
+
+        histogram.add(ns)
+
+    @classmethod
+    def count(cls, name, value=1):
+        if cls.enabled:
+            cls.counters[name] = cls.counters.get(name, 0) + value
+
+    @classmethod
+    def stats(cls):
+        return {
+            'histograms': {
+                name: histogram.stats() for name, histogram in cls.histograms.items()},
+            'counters': dict(cls.counters),
+        }
+
+    @classmethod
+    def summary(cls, names):
+        texts = []
+        for name in names:
+            if name in cls.histograms:
+                stats = cls.histograms[name].stats()
+                texts.append(f'{name} {stats["p50_ms"]:.1f}/{stats["p95_ms"]:.1f} ms')
+
+        texts += [f'{name} {value:,}' for name, value in cls.counters.items()]
+        return ', '.join(texts)
+
+    @classmethod
+    def dump(cls, file_name):
+        with open(file_name, 'w') as f:
+            json.dump(cls.stats(), f, indent=2)
+
+    @classmethod
+    def reset(cls):
+        cls.histograms = {}
+        cls.counters = {}
+
+
+def profiled(name=None):
+    """This decorator records the call time of the decorated function in the
+       Profiler, under name or the qualified name of the function."""
+    def decorator(func):
+        site = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not Profiler.enabled:
+                return func(*args, **kwargs)
+
+            start = time.perf_counter_ns()
+            result = func(*args, **kwargs)
+            Profiler.record(site, time.perf_counter_ns() - start)
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profile_block(name):
+    """This context manager records the time of the with block in the Profiler."""
+    if not Profiler.enabled:
+        yield
+        return
+
+    start = time.perf_counter_ns()
+    yield
+    Profiler.record(name, time.perf_counter_ns() - start)